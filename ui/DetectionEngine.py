@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import traceback
+from threading import Lock
+
+import numpy as np
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+from PyQt5.QtGui import QImage
+
+from ui.DetectionResults import DetectionResults
+
+# detect.py and its models/utils packages import each other as top-level modules
+YOLO_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'yolov7')
+
+_workers, _workers_lock = {}, Lock()
+
+
+def get_worker(device: str = ''):
+    # Process-wide DetectionWorker per device, engines share its resident models
+    with _workers_lock:
+        if device not in _workers:
+            if YOLO_PATH not in sys.path:
+                sys.path.insert(0, YOLO_PATH)
+            from detect_worker import DetectionWorker
+            _workers[device] = DetectionWorker(device)
+        return _workers[device]
+
+
+def to_qimage(frame: np.ndarray) -> QImage:
+    # Zero-copy QImage over a contiguous BGR uint8 frame, the frame must stay referenced while the image is used
+    h, w = frame.shape[:2]
+    if hasattr(QImage, 'Format_BGR888'):  # Qt >= 5.14
+        return QImage(frame.data, w, h, frame.strides[0], QImage.Format_BGR888)
+    return QImage(frame.data, w, h, frame.strides[0], QImage.Format_RGB888).rgbSwapped()  # copy
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class DetectionEngine(QThread):
+    # Runs detection jobs inside the GUI process on its own thread, keeping loaded models between jobs.
+    # Annotated frames are emitted at most display_fps times per second, inference runs at its own rate
+    frame_ready = pyqtSignal(object, dict)  # annotated BGR frame (numpy), stats
+    message = pyqtSignal(str)
+    job_finished = pyqtSignal(str)  # done, failed or cancelled
+
+    def __init__(self, device: str = '', display_fps: float = 30, parent=None):
+        super(DetectionEngine, self).__init__(parent)
+        self.device = device
+        self.display_fps = display_fps
+        self.job = None
+        self.results = None  # DetectionResults collecting the running job's detections
+        self.frames, self.t0, self.t_emit, self.pending = 0, 0., 0., None
+
+    def submit(self, job: dict, results: DetectionResults = None) -> bool:
+        # Run job dict (detect.py options) on the engine thread, False if a job is still running
+        if self.isRunning():
+            return False
+        self.job, self.results = job, results
+        self.start()
+        return True
+
+    def cancel(self):
+        # Stop the running job after its current frame
+        self.requestInterruption()
+
+    def run(self):
+        self.frames, self.t0, self.t_emit, self.pending = 0, time.time(), 0., None
+        try:
+            get_worker(self.device).run(self.job, on_frame=self.on_frame)
+            state = 'done'
+        except JobCancelled:
+            state = 'cancelled'
+        except Exception:
+            self.message.emit(traceback.format_exc())
+            state = 'failed'
+        if self.pending:  # last frame, skipped by the display rate limit
+            self.frame_ready.emit(*self.pending)
+        self.job_finished.emit(state)
+
+    def on_frame(self, im0, det, info):
+        # detect() callback on the engine thread
+        if self.isInterruptionRequested():
+            raise JobCancelled
+        if self.results is not None:
+            self.results.add(info['path'], info['frame'], info['raw'], info['names'])
+        self.frames += 1
+        now = time.time()
+        info['fps'] = self.frames / max(now - self.t0, 1E-9)
+        self.pending = (im0, info)
+        if now - self.t_emit >= 1 / self.display_fps:
+            self.t_emit = now
+            self.frame_ready.emit(*self.pending)
+            self.pending = None
+
+
+class DetectionJob:
+    # Queued job dict and its state: queued, running, done, failed or cancelled
+    def __init__(self, job_id: int, job: dict):
+        self.id = job_id
+        self.job = job
+        self.state = 'queued'
+        self.progress = 0.  # fraction of the source done
+        self.fps = 0.
+        self.t0 = 0.  # start time
+        self.engine = None  # DetectionEngine while running
+        self.results = DetectionResults()
+
+    def eta(self):
+        # Seconds left extrapolated from the elapsed time, None while unknown
+        if self.state != 'running' or self.progress <= 0:
+            return None
+        return (time.time() - self.t0) * (1 - self.progress) / self.progress
+
+
+class JobQueue(QObject):
+    # Runs queued DetectionJobs in order on up to concurrency DetectionEngine threads. Engines share one
+    # DetectionWorker, every weights file is loaded once for the whole queue and runs one forward pass at a time;
+    # concurrent jobs overlap decoding, NMS, drawing and writing
+    job_updated = pyqtSignal(object)  # DetectionJob, on state and progress changes
+    frame_ready = pyqtSignal(object, dict)  # annotated frame of any running job, stats with the job id
+    message = pyqtSignal(str)
+
+    def __init__(self, concurrency: int = 1, device: str = '', display_fps: float = 30, parent=None):
+        super(JobQueue, self).__init__(parent)
+        self.concurrency = concurrency
+        self.device = device
+        self.display_fps = display_fps
+        self.jobs = []  # DetectionJob, in submission order
+        self.engines = []  # DetectionEngine, idle ones are reused
+
+    def add(self, job: dict) -> DetectionJob:
+        j = DetectionJob(len(self.jobs), job)
+        self.jobs.append(j)
+        self.job_updated.emit(j)
+        self.schedule()
+        return j
+
+    def set_concurrency(self, n: int):
+        # Takes effect as running jobs finish, running jobs are not stopped
+        self.concurrency = max(int(n), 1)
+        self.schedule()
+
+    def cancel(self, job_id: int):
+        # Remove a queued job or stop a running one after its current frame
+        j = self.jobs[job_id]
+        if j.state == 'queued':
+            j.state = 'cancelled'
+            self.job_updated.emit(j)
+        elif j.state == 'running':
+            j.engine.cancel()
+
+    def cancel_all(self, wait: bool = False):
+        for j in self.jobs:
+            self.cancel(j.id)
+        if wait:
+            for e in self.engines:
+                e.wait()
+
+    def running(self):
+        return [j for j in self.jobs if j.state == 'running']
+
+    def schedule(self):
+        # Start queued jobs on idle engines while below concurrency
+        queued = [j for j in self.jobs if j.state == 'queued']
+        busy = {id(j.engine) for j in self.running()}
+        while queued and len(busy) < self.concurrency:
+            engine = next((e for e in self.engines if id(e) not in busy), None)
+            if engine is None:
+                engine = DetectionEngine(self.device, self.display_fps, parent=self)
+                engine.frame_ready.connect(self.on_frame)
+                engine.message.connect(self.message)
+                engine.job_finished.connect(self.on_finished)
+                self.engines.append(engine)
+            engine.wait()  # returning from the last job's run()
+            j = queued.pop(0)
+            j.state, j.engine, j.t0 = 'running', engine, time.time()
+            engine.submit(j.job, j.results)
+            busy.add(id(engine))
+            self.job_updated.emit(j)
+
+    def job_of(self, engine):
+        return next(j for j in self.jobs if j.engine is engine and j.state == 'running')
+
+    def on_frame(self, frame, info: dict):
+        j = self.job_of(self.sender())
+        j.progress, j.fps = info['progress'], info['fps']
+        info['job'] = j.id
+        self.job_updated.emit(j)
+        self.frame_ready.emit(frame, info)
+
+    def on_finished(self, state: str):
+        j = self.job_of(self.sender())
+        j.state, j.engine = state, None
+        j.progress = 1. if state == 'done' else j.progress
+        self.job_updated.emit(j)
+        self.schedule()
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+
+
+class DetectionResults:
+    # Detections of every image/frame of a job down to a low confidence threshold, so the GUI can re-filter them at
+    # any conf_thres >= that threshold and class filter without running the network again.
+    # add() is called from the engine thread, the other methods from the GUI thread
+    def __init__(self, max_items: int = 100000):
+        self.max_items = max_items  # frames kept, later ones are dropped
+        self.items = []  # (path, frame, det(n,6) float32 numpy [xyxy, conf, cls])
+        self.names = []
+        self.arrays = None  # concatenated (item index, conf, cls) of the first n items, rebuilt as items grow
+        self.colors = None
+
+    def add(self, path: str, frame: int, det: np.ndarray, names: list):
+        if len(self.items) < self.max_items:
+            self.names = names
+            self.items.append((path, frame, det.astype(np.float32)))
+
+    def __len__(self):
+        return len(self.items)
+
+    def class_ids(self, text: str):
+        # Class ids from a comma separated list of class names or ids, None for all classes
+        ids = []
+        for t in (x.strip() for x in text.split(',')):
+            if t.isdigit():
+                ids.append(int(t))
+            elif t in self.names:
+                ids.append(self.names.index(t))
+        return ids or None
+
+    def mask(self, det: np.ndarray, conf_thres: float, classes=None):
+        m = det[:, 4] >= conf_thres
+        return m & np.isin(det[:, 5], classes) if classes is not None else m
+
+    def counts(self, conf_thres: float, classes=None):
+        # Per class detection totals over all items at conf_thres, vectorized over all stored detections
+        n = len(self.items)
+        if self.arrays is None or self.arrays[0] != n:
+            dets = [det[:, 4:6] for _, _, det in self.items[:n]]
+            self.arrays = n, np.concatenate(dets) if dets else np.zeros((0, 2), dtype=np.float32)
+        x = self.arrays[1]
+        m = x[:, 0] >= conf_thres
+        if classes is not None:
+            m &= np.isin(x[:, 1], classes)
+        counts = np.bincount(x[m, 1].astype(int), minlength=len(self.names))
+        return {self.names[c]: int(counts[c]) for c in np.nonzero(counts)[0]}
+
+    def image(self, i: int):
+        # Original BGR image of item i, video frames are seeked to
+        path, frame, _ = self.items[i]
+        if not frame:
+            return cv2.imread(path)
+        cap = cv2.VideoCapture(path)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame - 1)  # frame is 1-based
+        ret_val, img = cap.read()
+        cap.release()
+        return img if ret_val else None
+
+    def render(self, i: int, conf_thres: float, classes=None):
+        # Item i drawn with its detections at conf_thres, returns (BGR image or None, number of detections)
+        from utils.plots import plot_one_box  # yolov7 on sys.path, see DetectionEngine.get_worker()
+
+        if self.colors is None or len(self.colors) < len(self.names):
+            self.colors = np.random.RandomState(0).randint(0, 255, (max(len(self.names), 1), 3)).tolist()
+        det = self.items[i][2]
+        det = det[self.mask(det, conf_thres, classes)]
+        img = self.image(i)
+        if img is not None:
+            for *xyxy, conf, cls in det[::-1]:
+                plot_one_box(xyxy, img, label=f'{self.names[int(cls)]} {conf:.2f}', color=self.colors[int(cls)],
+                             line_thickness=1)
+        return img, len(det)
@@ -1,17 +1,24 @@
+import codecs
 import datetime
+import json
 import os
 import sys
 
 from PyQt5 import uic
-from PyQt5.QtWidgets import QMainWindow, QPushButton, QLineEdit, QFileDialog, QTextEdit
-from PyQt5.QtGui import QIcon, QRegExpValidator, QTextCursor
-from PyQt5.QtCore import QRegExp, QProcess, QByteArray
+from PyQt5.QtWidgets import QMainWindow, QPushButton, QLineEdit, QFileDialog, QPlainTextEdit, QCheckBox, QLabel, \
+    QSpinBox, QTableWidget, QTableWidgetItem, QProgressBar, QSlider
+from PyQt5.QtGui import QIcon, QRegExpValidator, QTextCursor, QPixmap
+from PyQt5.QtCore import Qt, QRegExp, QProcess, QTimer
+
+from ui.DetectionEngine import JobQueue, to_qimage
 
 
 class MainWindowModel:
     def __init__(self):
         self.window_title: str = "GUI YOLOv7 Object Detector"
         self.ui_path: str = "ui/MainWindow.ui"
+        self.worker_path: str = "yolov7/detect_worker.py"
+        self.cache_path: str = "runs/cache"  # detection cache, re-runs of seen images skip the network
         self.window_icon_path: str = "icons/logo.png"
         self.source_base_path: str = "data/example.jpg"
         self.weight_base_path: str = "weights/yolov7_x_640_sgd_best.pt"
@@ -19,11 +26,24 @@ class MainWindowModel:
         self.weight_path_dialog_txt: str = "Выберите файл нейросетевых весов"
         self.weight_extensions_dialog_txt: str = "PyTorch weights (*.pt)"
         self.source_path_dialog_txt: str = "Выберите файл с входными данными"
+        self.source_files_dialog_txt: str = "Выберите файлы для очереди детектирования"
+        self.source_folder_dialog_txt: str = "Выберите каталог для очереди детектирования"
         self.source_extenstions_dialog_txt: str = "Source file (*.jpg *.jpeg *.png *.avi *mp4)"
         self.save_path_dialog_txt: str = "Выберите каталог для сохранения результатов детектирования"
         self.edit_path_base_txt: str = "Выберите путь, нажав клавишу 'Обзор...'"
 
         self.detection_start_msg: str = "Процесс детектирования начат. Ожидайте результатов!\n"
+        self.detection_done_msg: str = "Детектирование завершено\n"
+        self.detection_failed_msg: str = "Детектирование прервано\n"
+        self.detection_cancelled_msg: str = "Детектирование отменено\n"
+        self.preview_fps: float = 30  # max live preview redraws per second
+        self.raw_conf_thres: float = 0.05  # queue jobs keep detections down to it, lower thresholds need a re-run
+        self.output_interval_ms: int = 100  # log and progress refresh period
+        self.output_chunk_chars: int = 20000  # max log text appended per refresh, older text is skipped
+        self.output_max_lines: int = 5000  # log size cap, oldest lines are dropped
+        self.output_skipped_msg: str = "... пропущено символов: {}\n"
+        self.job_states: dict = {"queued": "В очереди", "running": "Выполняется", "done": "Готово",
+                                 "failed": "Ошибка", "cancelled": "Отменено"}
 
         # Error messages
         self.unicode_err_msg: str = "Произошла ошибка! Проверьте правильность входных данных"
@@ -36,8 +56,45 @@ class MainWindowController:
 
         # Set updating Ui for yolo messages
         self.yolo_process = QProcess()
-        self.yolo_process.started.connect(self.detection_output_clear)
-        self.yolo_process.readyRead.connect(self.detection_output_update)
+        # Worker stdout is the log, stderr carries JSON lines progress (detect.py --progress-fd 2) and warnings.
+        # Both are buffered here and shown once per output_interval_ms
+        self.yolo_process.readyReadStandardOutput.connect(self.read_worker_output)
+        self.yolo_process.readyReadStandardError.connect(self.read_worker_progress)
+        self.output_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.output_buffer: list = []  # log text not shown yet
+        self.progress_tail: bytes = b''  # incomplete progress line
+        self.progress = None  # latest progress dict not shown yet
+        self.output_timer = QTimer()
+        self.output_timer.timeout.connect(self.flush_output)
+        self.output_timer.start(main_model.output_interval_ms)
+
+        self.results = None  # DetectionResults of the job shown for threshold and class filter tuning
+
+        # In-process job queue, its engine threads share loaded models and feed the live preview
+        self.job_queue = JobQueue(display_fps=main_model.preview_fps)
+        self.job_queue.frame_ready.connect(self.preview_update)
+        self.job_queue.message.connect(self.detection_output_append)
+        self.job_queue.job_updated.connect(self.job_update)
+
+    def start_worker(self):
+        # Start the resident detection worker once, it keeps loaded weights between runs
+        if self.yolo_process.state() != QProcess.NotRunning:
+            return
+        # -u -> unbuffered stdout for live progress, sys.executable -> for using venv dependencies
+        self.yolo_process.start(sys.executable, ['-u', self.main_model.worker_path])
+        self.yolo_process.waitForStarted()
+
+    def stop_worker(self):
+        # Close worker stdin so it exits after the current job, kill it if it hangs
+        if self.yolo_process.state() == QProcess.NotRunning:
+            return
+        self.yolo_process.closeWriteChannel()
+        if not self.yolo_process.waitForFinished(3000):
+            self.yolo_process.kill()
+
+    def stop_queue(self):
+        # Cancel queued and running in-process jobs and wait for the engine threads
+        self.job_queue.cancel_all(wait=True)
 
     def init_gui_pathes(self, gui_paths: dict):
         for edit, base_path in gui_paths.items():
@@ -69,50 +126,215 @@ class MainWindowController:
             return
         self.main_window.source_path_edit.setText(file_path)
 
-    def detect_objects(self):
-        file_path = QFileDialog.getExistingDirectory(self.main_window,
-                                                     self.main_model.save_path_dialog_txt,
-                                                     os.getcwd()
-                                                     )
-        if not file_path:
-            return
+    def save_dir_dialog(self) -> str:
+        return QFileDialog.getExistingDirectory(self.main_window,
+                                                self.main_model.save_path_dialog_txt,
+                                                os.getcwd()
+                                                )
 
-        # variables initialization for next usage
+    def make_job(self, source_path: str, file_path: str, suffix: str = ""):
+        # detect.py options for source_path saved under file_path, None if the threshold is invalid
         weight_path = self.main_window.weight_edit.text()
-        source_path = self.main_window.source_path_edit.text()
         project_path = weight_path[weight_path.rfind('/') + 1: weight_path.rfind('.pt')]
         current_time = datetime.datetime.now().strftime("%m_%d_%Y__%H_%M_%S")
+        try:
+            conf_thres = float(self.main_window.threshold_edit.text())
+        except ValueError:
+            self.main_window.detection_output_edit.setPlainText(self.main_model.unicode_err_msg)
+            return None
+        return {"weights": weight_path, "conf_thres": conf_thres,
+                "img_size": 640, "source": source_path, "no_trace": True, "save_txt": True,
+                "cache": self.main_model.cache_path,
+                "project": f"{file_path}/{project_path}_detections",
+                "name": f"detection_{current_time}{suffix}"}
 
-        # Call yolo by using QProcess
-        cmd = ['./yolov7/detect.py', "--weights", weight_path, "--conf",
-               self.main_window.threshold_edit.text(),
-               "--img-size", "640", '--source', source_path, "--no-trace", "--save-txt",
-               "--project",
-               f"{file_path}/{project_path}_detections",
-               "--name", f"detection_{current_time}"]
+    def detect_objects(self):
+        file_path = self.save_dir_dialog()
+        if not file_path:
+            return
+        job = self.make_job(self.main_window.source_path_edit.text(), file_path)
+        if job is None:
+            return
 
-        self.yolo_process.start(sys.executable, cmd)  # sys.executable -> for using venv dependencies
+        # Run in this process to show annotated frames, otherwise send job to the yolo worker process
+        self.detection_output_clear()
+        if self.main_window.preview_check.isChecked():
+            self.queue_job(job)
+            return
+        self.show_results(None)  # worker jobs keep no detections to re-filter
+        self.start_worker()
+        job["progress_fd"] = 2  # stderr
+        self.yolo_process.write((json.dumps(job) + '\n').encode())
 
-    def detection_output_update(self):
-        if self.main_window.detection_output_edit is None:
+    def add_files_clicked(self):
+        # Queue one job per selected file
+        files = QFileDialog.getOpenFileNames(self.main_window,
+                                             self.main_model.source_files_dialog_txt,
+                                             os.getcwd(),
+                                             self.main_model.source_extenstions_dialog_txt)[0]
+        file_path = self.save_dir_dialog() if files else ""
+        if not file_path:
             return
+        jobs = [self.make_job(source, file_path, f"_{i}") for i, source in enumerate(files)]
+        for job in jobs:
+            if job is not None:
+                self.queue_job(job)
 
+    def add_folder_clicked(self):
+        # Queue all images and videos of a folder as one job
+        source = QFileDialog.getExistingDirectory(self.main_window,
+                                                  self.main_model.source_folder_dialog_txt,
+                                                  os.getcwd())
+        file_path = self.save_dir_dialog() if source else ""
+        if not file_path:
+            return
+        job = self.make_job(source, file_path)
+        if job is not None:
+            self.queue_job(job)
+
+    def queue_job(self, job: dict):
+        # In-process job, its low confidence detections are kept for re-filtering
+        job["raw_conf_thres"] = self.main_model.raw_conf_thres
+        self.job_queue.add(job)
+
+    def cancel_jobs_clicked(self):
+        # Cancel the selected queue jobs, or all of them and the worker process job if none are selected
+        rows = {index.row() for index in self.main_window.jobs_table.selectionModel().selectedRows()}
+        for row in rows:
+            self.job_queue.cancel(row)
+        if rows:
+            return
+        self.job_queue.cancel_all()
+        if self.yolo_process.state() != QProcess.NotRunning:
+            self.yolo_process.kill()  # restarted by the next job
+            self.detection_output_append(self.main_model.detection_cancelled_msg)
+
+    def concurrency_changed(self, n: int):
+        self.job_queue.set_concurrency(n)
+
+    def job_update(self, job):
+        table: QTableWidget = self.main_window.jobs_table
+        row = job.id
+        if row >= table.rowCount():
+            table.insertRow(row)
+            table.setItem(row, 0, QTableWidgetItem(str(job.job["source"])))
+            table.setItem(row, 1, QTableWidgetItem())
+            table.setItem(row, 3, QTableWidgetItem())
+            table.setCellWidget(row, 2, QProgressBar())
+        eta = job.eta()
+        table.item(row, 1).setText(self.main_model.job_states[job.state])
+        table.cellWidget(row, 2).setValue(int(job.progress * 100))
+        table.item(row, 3).setText(str(datetime.timedelta(seconds=round(eta))) if eta is not None else "")
+        if job.results is self.results:  # shown job still collecting
+            self.main_window.result_slider.setMaximum(max(len(job.results) - 1, 0))
+        if job.state in ("done", "failed", "cancelled"):
+            self.detection_finished(job.state)
+            if not table.selectionModel().hasSelection():
+                self.show_results(job.results)
+
+    def job_selected(self):
+        rows = self.main_window.jobs_table.selectionModel().selectedRows()
+        if rows:
+            self.show_results(self.job_queue.jobs[rows[0].row()].results)
+
+    def show_results(self, results):
+        # Show a queue job's DetectionResults, None disables the re-filter controls and clears the preview
+        self.results = results
+        slider: QSlider = self.main_window.result_slider
+        slider.blockSignals(True)
+        slider.setRange(0, max(len(results) - 1, 0) if results is not None else 0)
+        slider.setValue(0)
+        slider.blockSignals(False)
+        slider.setEnabled(results is not None)
+        self.main_window.class_filter_edit.setEnabled(results is not None)
+        if results is None:
+            self.main_window.preview_label.clear()
+            return
+        self.results_update()
+
+    def results_update(self):
+        # Re-filter the kept detections at the current threshold and classes and redraw the selected image
+        results = self.results
+        if not results:
+            return
         try:
-            output_bytes: QByteArray = self.yolo_process.readAll()
-            output_string: str = bytes(output_bytes).decode()
-        except UnicodeDecodeError:
-            self.main_window.detection_output_edit.setText(self.main_model.unicode_err_msg)
+            conf_thres = float(self.main_window.threshold_edit.text())
+        except ValueError:
             return
-        cursor: QTextCursor = QTextCursor(self.main_window.detection_output_edit.document())
-        cursor.movePosition(QTextCursor.End)
-        cursor.insertText(output_string)
-        self.main_window.detection_output_edit.verticalScrollBar().setValue(
-            self.main_window.detection_output_edit.verticalScrollBar().maximum()
-        )
+        classes = results.class_ids(self.main_window.class_filter_edit.text())
+        i = min(self.main_window.result_slider.value(), len(results) - 1)
+        img, n = results.render(i, conf_thres, classes)
+        if img is not None:
+            label = self.main_window.preview_label
+            pixmap = QPixmap.fromImage(to_qimage(img))
+            label.setPixmap(pixmap.scaled(label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        counts = ", ".join(f"{c} {name}" for name, c in results.counts(conf_thres, classes).items())
+        path, frame, _ = results.items[i]
+        self.main_window.statusBar().showMessage(
+            f"{i + 1}/{len(results)} {os.path.basename(path)}{f' ({frame})' if frame else ''}: {n}  |  {counts}")
+
+    def read_worker_output(self):
+        self.output_buffer.append(self.output_decoder.decode(bytes(self.yolo_process.readAllStandardOutput())))
+
+    def read_worker_progress(self):
+        # Keep only the latest progress line, anything else on stderr goes to the log
+        lines = (self.progress_tail + bytes(self.yolo_process.readAllStandardError())).split(b'\n')
+        self.progress_tail = lines.pop()
+        for line in lines:
+            try:
+                progress = json.loads(line)
+            except ValueError:
+                progress = None
+            if isinstance(progress, dict):
+                self.progress = progress
+            else:
+                self.output_buffer.append(line.decode(errors='replace') + '\n')
+
+    def detection_output_append(self, output_string: str):
+        self.output_buffer.append(output_string)
+
+    def flush_output(self):
+        # Append the buffered log text in one insert of at most output_chunk_chars and show the latest progress
+        if self.output_buffer:
+            text = ''.join(self.output_buffer)
+            self.output_buffer = []
+            chunk = self.main_model.output_chunk_chars
+            if len(text) > chunk:
+                skipped = text.find('\n', len(text) - chunk) + 1 or len(text) - chunk  # whole lines if possible
+                text = self.main_model.output_skipped_msg.format(skipped) + text[skipped:]
+            edit: QPlainTextEdit = self.main_window.detection_output_edit
+            cursor: QTextCursor = QTextCursor(edit.document())
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(text)
+            edit.verticalScrollBar().setValue(edit.verticalScrollBar().maximum())
+        if self.progress:
+            p, self.progress = self.progress, None
+            counts = ", ".join(f"{n} {c}" for c, n in p.get("counts", {}).items())
+            frames = f"{p.get('frame', 0)}/{p['nframes']}" if p.get("nframes") else f"{p['images']}"
+            self.main_window.statusBar().showMessage(
+                f"{os.path.basename(p.get('path', ''))} {frames}  {p.get('progress', 0):.1%}  {p['fps']:.1f} FPS  "
+                f"{p['detections']} det  {counts}")
+
+    def detection_finished(self, state: str):
+        self.detection_output_append({"done": self.main_model.detection_done_msg,
+                                      "failed": self.main_model.detection_failed_msg,
+                                      "cancelled": self.main_model.detection_cancelled_msg}[state])
+
+    def preview_update(self, frame, info: dict):
+        # Show an annotated BGR frame from the engine, the QImage shares the frame memory until the pixmap is made
+        if not self.main_window.preview_check.isChecked():
+            return
+        label = self.main_window.preview_label
+        pixmap = QPixmap.fromImage(to_qimage(frame))
+        label.setPixmap(pixmap.scaled(label.size(), Qt.KeepAspectRatio, Qt.FastTransformation))
+        frames = f"{info['frame']}/{info['nframes']}" if info['nframes'] else f"{info['frame']}"
+        self.main_window.statusBar().showMessage(
+            f"#{info['job']} {os.path.basename(info['path'])} {frames}  {info['fps']:.1f} FPS  {info['summary']}")
 
     def detection_output_clear(self):
         # Clean old text and set new start text
-        self.main_window.detection_output_edit.setText(self.main_model.detection_start_msg)
+        self.output_buffer = []
+        self.main_window.detection_output_edit.setPlainText(self.main_model.detection_start_msg)
 
 
 class MainWindowView(QMainWindow):
@@ -133,7 +355,19 @@ class MainWindowView(QMainWindow):
         self.source_path_edit: QLineEdit = self.findChild(QLineEdit, "SourcePathLineEdit")
         self.weight_edit: QLineEdit = self.findChild(QLineEdit, "WeightPathLineEdit")
         self.threshold_edit: QLineEdit = self.findChild(QLineEdit, "ThresholdLineEdit")
-        self.detection_output_edit: QTextEdit = self.findChild(QTextEdit, "DetectionOutputTextEdit")
+        self.detection_output_edit: QPlainTextEdit = self.findChild(QPlainTextEdit, "DetectionOutputTextEdit")
+        self.detection_output_edit.setMaximumBlockCount(self.model.output_max_lines)
+        self.preview_check: QCheckBox = self.findChild(QCheckBox, "PreviewCheckBox")
+        self.preview_label: QLabel = self.findChild(QLabel, "PreviewLabel")
+        self.add_files_button: QPushButton = self.findChild(QPushButton, "AddFilesButton")
+        self.add_folder_button: QPushButton = self.findChild(QPushButton, "AddFolderButton")
+        self.cancel_jobs_button: QPushButton = self.findChild(QPushButton, "CancelJobsButton")
+        self.concurrency_spin: QSpinBox = self.findChild(QSpinBox, "ConcurrencySpinBox")
+        self.jobs_table: QTableWidget = self.findChild(QTableWidget, "JobsTableWidget")
+        self.jobs_table.horizontalHeader().setStretchLastSection(True)
+        self.jobs_table.setColumnWidth(0, 900)
+        self.class_filter_edit: QLineEdit = self.findChild(QLineEdit, "ClassFilterLineEdit")
+        self.result_slider: QSlider = self.findChild(QSlider, "ResultSlider")
 
         # Update UI with base  pathes
         self.controller.init_gui_pathes(
@@ -148,8 +382,21 @@ class MainWindowView(QMainWindow):
         self.threshold_edit.setValidator(validator)
         self.clicked_action_connect()
 
+    def closeEvent(self, event):
+        self.controller.stop_worker()
+        self.controller.stop_queue()
+        super(MainWindowView, self).closeEvent(event)
+
     def clicked_action_connect(self):
         # Connect listeners to buttons
         self.weight_button.clicked.connect(self.controller.weight_button_clicked)
         self.source_path_button.clicked.connect(self.controller.source_button_clicked)
         self.detect_objects_button.clicked.connect(self.controller.detect_objects)
+        self.add_files_button.clicked.connect(self.controller.add_files_clicked)
+        self.add_folder_button.clicked.connect(self.controller.add_folder_clicked)
+        self.cancel_jobs_button.clicked.connect(self.controller.cancel_jobs_clicked)
+        self.concurrency_spin.valueChanged.connect(self.controller.concurrency_changed)
+        self.jobs_table.itemSelectionChanged.connect(self.controller.job_selected)
+        self.threshold_edit.textChanged.connect(self.controller.results_update)
+        self.class_filter_edit.textChanged.connect(self.controller.results_update)
+        self.result_slider.valueChanged.connect(self.controller.results_update)
@@ -0,0 +1,215 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+from models.experimental import attempt_load
+from models.yolo import Model
+from utils.datasets import LoadImages, letterbox, load_letterboxed_batch, img_formats
+from utils.general import check_file, check_img_size, non_max_suppression_batched, scale_coords, set_logging, \
+    increment_path
+from utils.timing import StageTimer
+from utils.torch_utils import select_device, git_describe, time_synchronized, InputBuffer
+
+VERSION = 1  # benchmark.json schema version, bump when fields change meaning
+
+
+def peak_rss():
+    # Peak resident set size of this process in MB, None where unavailable (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1E6 if sys.platform == 'darwin' else rss / 1E3  # bytes on macOS, KB on Linux
+
+
+def build_model(name, device):
+    # Fused eval model from *.yaml (random weights, seeded) or *.pt weights
+    if name.endswith(('.yaml', '.yml')):
+        torch.manual_seed(0)
+        model = Model(check_file(name)).fuse().eval()
+    else:
+        model = attempt_load(name, map_location=device)
+    return model.to(device)
+
+
+def synthetic_batches(batch_size, img_size, stride, shape=(720, 1280)):
+    # Infinite (img, imgs0) batches of seeded random BGR frames letterboxed to img_size
+    rng = np.random.RandomState(0)
+    imgs0 = [rng.randint(0, 255, (*shape, 3), dtype=np.uint8) for _ in range(batch_size)]
+    while True:
+        img = np.stack([letterbox(x, img_size, auto=False, stride=stride)[0] for x in imgs0], 0)
+        img = np.ascontiguousarray(img[:, :, :, ::-1].transpose(0, 3, 1, 2))  # BGR to RGB, to bsx3xhxw
+        yield img, imgs0
+
+
+def folder_batches(source, batch_size, img_size, stride):
+    # Infinite (img, imgs0) batches decoded from the images in source, cycling over them
+    files = [f for f in LoadImages(source, img_size=img_size, stride=stride).files
+             if f.split('.')[-1].lower() in img_formats]
+    assert files, f'No images found in {source}'
+    i = 0
+    while True:
+        paths = [files[(i + j) % len(files)] for j in range(batch_size)]
+        i += batch_size
+        yield load_letterboxed_batch(paths, (img_size, img_size), stride)
+
+
+class LayerTimer:
+    # Per-layer forward time in ms via hooks on Model.model layers, summed over calls while enabled
+    def __init__(self, model):
+        self.enabled, self.t, self.times, self.handles = False, {}, defaultdict(float), []
+        for m in getattr(model, 'model', []):
+            if hasattr(m, 'i'):  # Model layer with index and type
+                self.handles.append(m.register_forward_pre_hook(self.pre))
+                self.handles.append(m.register_forward_hook(self.post))
+
+    def pre(self, m, x):
+        if self.enabled:
+            self.t[m.i] = time_synchronized()
+
+    def post(self, m, x, y):
+        if self.enabled:
+            self.times[f'{m.i} {m.type}'] += (time_synchronized() - self.t[m.i]) * 1E3
+
+    def remove(self):
+        for h in self.handles:
+            h.remove()
+
+
+def run(model, batches, device, iters=50, warmup=5, layer_iters=5, conf_thres=0.25, iou_thres=0.45):
+    # Benchmark the detect.py pipeline (letterbox, preprocess, forward, NMS, rescale) over iters batches.
+    # Returns a result dict with throughput, per-stage latency percentiles and per-layer ms per batch
+    timer = StageTimer()
+    layers = LayerTimer(model)
+    inputs = InputBuffer(device)
+    n = 0
+    for i in range(warmup + iters + layer_iters):
+        measure = warmup <= i < warmup + iters
+        layers.enabled = i >= warmup + iters  # hooks add overhead, layers are timed on separate batches
+        tm = timer if measure else StageTimer()  # warmup and layer batches are discarded
+        t = time_synchronized()
+        with tm('load'):
+            img, imgs0 = next(batches)
+        with tm('preprocess'):
+            img = inputs(img)  # uint8 to fp32 0.0 - 1.0
+        with tm('forward'):
+            pred = model(img)[0]
+        with tm('nms'):
+            pred = non_max_suppression_batched(pred, conf_thres, iou_thres)
+        with tm('rescale'):
+            for det, im0 in zip(pred, imgs0):
+                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape).round()
+        tm.add('total', (time_synchronized() - t) * 1E3)
+        n += len(imgs0) if measure else 0
+    layers.remove()
+
+    stages = timer.summary()
+    total = stages['total']['total'] / 1E3  # s
+    return {'images': n,
+            'throughput': n / total if total else 0.,  # img/s
+            'latency': stages,  # ms per batch
+            'layers': {k: v / max(layer_iters, 1) for k, v in layers.times.items()},  # ms per batch
+            'peak_rss': peak_rss()}  # MB, process peak so far
+
+
+def compare(new, old):
+    # Print throughput and p50 batch latency changes of results in new against matching results in old
+    key = lambda r: (r['model'], r['source'], r['img_size'], r['batch_size'])
+    old = {key(r): r for r in old['results']}
+    print(f"\n{'model':>24}{'source':>12}{'size':>6}{'bs':>4}{'img/s':>10}{'change':>9}{'p50 ms':>10}{'change':>9}")
+    for r in new['results']:
+        o = old.get(key(r))
+        if o:
+            p, po = r['latency']['total']['p50'], o['latency']['total']['p50']
+            print(f"{Path(r['model']).name[-24:]:>24}{Path(r['source']).name[-12:]:>12}{r['img_size']:>6}"
+                  f"{r['batch_size']:>4}{r['throughput']:>10.1f}{r['throughput'] / o['throughput'] - 1:>+9.1%}"
+                  f"{p:>10.1f}{p / po - 1:>+9.1%}")
+
+
+def benchmark(opt):
+    device = select_device(opt.device)
+    if opt.threads:
+        torch.set_num_threads(opt.threads)
+    save_dir = increment_path(Path(opt.project) / opt.name, exist_ok=opt.exist_ok)
+    save_dir.mkdir(parents=True, exist_ok=True)
+    report = {'version': VERSION,
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'git': git_describe(),
+              'python': platform.python_version(),
+              'torch': torch.__version__,
+              'opencv': cv2.__version__,
+              'platform': platform.platform(),
+              'processor': platform.processor(),
+              'device': str(device),
+              'threads': torch.get_num_threads(),
+              'options': vars(opt),
+              'results': []}
+
+    with torch.no_grad():
+        for name in opt.models:
+            model = build_model(name, device)
+            stride = int(model.stride.max())
+            for source in opt.source:
+                for img_size in opt.img_size:
+                    img_size = check_img_size(img_size, s=stride)
+                    for bs in opt.batch_size:
+                        batches = synthetic_batches(bs, img_size, stride) if source == 'synthetic' else \
+                            folder_batches(source, bs, img_size, stride)
+                        r = run(model, batches, device, opt.iters, opt.warmup, opt.layer_iters, opt.conf_thres,
+                                opt.iou_thres)
+                        r = {'model': name, 'source': source, 'img_size': img_size, 'batch_size': bs, **r}
+                        report['results'].append(r)
+                        s = r['latency']['total']
+                        print(f"{name} {source} {img_size} bs{bs}: {r['throughput']:.1f} img/s, batch latency "
+                              f"p50 {s['p50']:.1f}ms p95 {s['p95']:.1f}ms p99 {s['p99']:.1f}ms, "
+                              f"forward {r['latency']['forward']['mean']:.1f}ms, peak RSS {r['peak_rss'] or 0:.0f}MB")
+            del model
+
+    f = save_dir / 'benchmark.json'
+    with open(f, 'w') as fp:
+        json.dump(report, fp, indent=2)
+    print(f'Results saved to {f}')
+    if opt.compare:
+        with open(opt.compare) as fp:
+            old = json.load(fp)
+        if old.get('version') != VERSION:
+            print(f"WARNING: comparing against benchmark.json version {old.get('version')}, this is version {VERSION}")
+        compare(report, old)
+    return report
+
+
+def parse_opt(args=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--models', nargs='+', type=str, default=['cfg/deploy/yolov7-tiny.yaml'],
+                        help='model *.yaml (random weights) or *.pt path(s)')
+    parser.add_argument('--source', nargs='+', type=str, default=['synthetic'], help='synthetic and/or image folder(s)')
+    parser.add_argument('--img-size', nargs='+', type=int, default=[320, 640], help='inference size(s) (pixels)')
+    parser.add_argument('--batch-size', nargs='+', type=int, default=[1, 4], help='batch size(s)')
+    parser.add_argument('--iters', type=int, default=50, help='timed batches per workload')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed batches per workload')
+    parser.add_argument('--layer-iters', type=int, default=5, help='batches timed per layer, 0 to disable')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='object confidence threshold')
+    parser.add_argument('--iou-thres', type=float, default=0.45, help='IOU threshold for NMS')
+    parser.add_argument('--device', default='cpu', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads, 0 for default')
+    parser.add_argument('--project', default='runs/benchmark', help='save results to project/name')
+    parser.add_argument('--name', default='exp', help='save results to project/name')
+    parser.add_argument('--exist-ok', action='store_true', help='existing project/name ok, do not increment')
+    parser.add_argument('--compare', type=str, default='', help='previous benchmark.json to diff against')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    opt = parse_opt()
+    print(opt)
+    set_logging()
+    benchmark(opt)
@@ -7,39 +7,107 @@ import torch
 import torch.backends.cudnn as cudnn
 from numpy import random
 
-from models.experimental import attempt_load
-from utils.datasets import LoadStreams, LoadImages
-from utils.general import check_img_size, check_requirements, check_imshow, non_max_suppression, apply_classifier, \
-    scale_coords, xyxy2xywh, strip_optimizer, set_logging, increment_path
+from models.experimental import attempt_load, ORTModel
+from utils.cache import DetectionCache
+from utils.datasets import LoadStreams, LoadImages, LoadImageBatches, PrefetchLoader, tile_batches
+from utils.general import check_img_size, check_requirements, check_imshow, non_max_suppression_batched, \
+    apply_classifier, scale_coords, clip_coords, xyxy2xywh, strip_optimizer, set_logging, increment_path, merge_detections
+from utils.motion import MotionGate
 from utils.plots import plot_one_box
-from utils.torch_utils import select_device, load_classifier, time_synchronized, TracedModel
+from utils.timing import StageTimer, stage
+from utils.tracker import Tracker
+from utils.torch_utils import select_device, load_classifier, time_synchronized, TracedModel, file_hash, \
+    InputBuffer
+from utils.writer import ResultWriter, DetectionSink, ProgressStream
 
 
-def detect(save_img=False):
-    source, weights, view_img, save_txt, imgsz, trace = opt.source, opt.weights, opt.view_img, opt.save_txt, opt.img_size, not opt.no_trace
-    save_img = not opt.nosave and not source.endswith('.txt')  # save inference images
-    webcam = source.isnumeric() or source.endswith('.txt') or source.lower().startswith(
-        ('rtsp://', 'rtmp://', 'http://', 'https://'))
+def load_model(weights, device, imgsz=640, trace=True, trace_cache='runs/traced', backend='torch',
+               intra_threads=0, inter_threads=0):
+    # Load FP32 model, check img_size against its stride, optionally trace it and cast to FP16 on CUDA
+    if backend == 'onnxruntime':  # exported *.onnx, optionally with NMS
+        model = ORTModel(weights[0] if isinstance(weights, list) else weights, intra_threads, inter_threads, device)
+        if model.img_size:  # fixed input shape
+            imgsz = min(model.img_size)
+        return model, check_img_size(imgsz, s=int(model.stride.max()))
 
-    # Directories
-    save_dir = Path(increment_path(Path(opt.project) / opt.name, exist_ok=opt.exist_ok))  # increment run
-    (save_dir / 'labels' if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
-
-    # Initialize
-    set_logging()
-    device = select_device(opt.device)
     half = device.type != 'cpu'  # half precision only supported on CUDA
-
-    # Load model
     model = attempt_load(weights, map_location=device)  # load FP32 model
     stride = int(model.stride.max())  # model stride
     imgsz = check_img_size(imgsz, s=stride)  # check img_size
 
+    if getattr(model, 'quantized', False):  # INT8 model from quantize.py
+        assert device.type == 'cpu', 'quantized models run on CPU only, use --device cpu'
+        return model, imgsz
+
     if trace:
-        model = TracedModel(model, device, opt.img_size)
+        model = TracedModel(model, device, imgsz, weights=weights, cache_dir=trace_cache)
 
     if half:
         model.half()  # to FP16
+    return model, imgsz
+
+
+def model_kwargs(opt):
+    # load_model() keyword arguments from detect.py options
+    return dict(imgsz=opt.img_size, trace=not opt.no_trace, trace_cache=opt.trace_cache, backend=opt.backend,
+                intra_threads=opt.intra_threads, inter_threads=opt.inter_threads)
+
+
+def video_kwargs(opt):
+    # LoadImages() video reader keyword arguments from detect.py options
+    return dict(vid_stride=opt.vid_stride, start=opt.start, end=opt.end, video_backend=opt.video_backend)
+
+
+def detect_tiles(model, im0, opt, device, half, conf_thres):
+    # Sliced inference of im0 at native resolution, returns (n,6) [xyxy, conf, cls] im0 pixel detections >= conf_thres
+    dets = []
+    for img, offsets in tile_batches(im0, opt.tile_size, opt.tile_overlap, opt.tile_batch):
+        img = torch.from_numpy(img).to(device)
+        img = img.half() if half else img.float()  # uint8 to fp16/32
+        img /= 255.0  # 0 - 255 to 0.0 - 1.0
+        pred = model(img, augment=opt.augment)[0]
+        if getattr(model, 'end2end', False):  # NMS done in the model
+            pred = ORTModel.filter(pred, conf_thres, classes=opt.classes)
+        else:
+            pred = non_max_suppression_batched(pred, conf_thres, opt.iou_thres, classes=opt.classes,
+                                               agnostic=opt.agnostic_nms)
+        for det, offset in zip(pred, torch.from_numpy(offsets).to(device)):
+            det[:, :4] += offset.repeat(2)  # tile to im0 pixels
+            dets.append(det)
+    det = torch.cat(dets, 0) if dets else torch.zeros((0, 6), device=device)
+    clip_coords(det, im0.shape)
+    return det
+
+
+def detect(opt, model=None, on_done=None, on_frame=None):
+    # Run inference with opt; a preloaded (model, imgsz) pair from load_model() skips loading the weights again.
+    # opt.source may also be a list of files. on_done(path, det) is called in order once the results of an image or
+    # frame are written, on_frame(im0, det, info) with every annotated image or frame on the inference thread. info has
+    # path, frame, nframes, progress (fraction of the source done, 0 for streams), detections, summary, names and raw,
+    # the (n,6) numpy detections down to --raw-conf-thres for re-filtering at other thresholds
+    source, weights, view_img, save_txt, imgsz, trace = opt.source, opt.weights, opt.view_img, opt.save_txt, opt.img_size, not opt.no_trace
+    save_img = not opt.nosave and not (isinstance(source, str) and source.endswith('.txt'))  # save inference images
+    webcam = isinstance(source, str) and (source.isnumeric() or source.endswith('.txt') or source.lower().startswith(
+        ('rtsp://', 'rtmp://', 'http://', 'https://')))
+
+    # Directories
+    save_dir = Path(increment_path(Path(opt.project) / opt.name, exist_ok=opt.exist_ok))  # increment run
+    (save_dir / 'labels' if save_txt else save_dir).mkdir(parents=True, exist_ok=True)  # make dir
+
+    # Initialize
+    set_logging()
+    if opt.threads:
+        torch.set_num_threads(opt.threads)
+    if model is None:
+        device = select_device(opt.device)
+        model, imgsz = load_model(weights, device, **model_kwargs(opt))  # load model
+    else:
+        model, imgsz = model  # resident model
+    device = model.device if isinstance(model, ORTModel) else next(model.parameters()).device
+    half = device.type != 'cpu'  # half precision only supported on CUDA
+    stride = int(model.stride.max())  # model stride
+    if opt.tile_size:
+        opt.tile_size = check_img_size(opt.tile_size, s=stride)  # check tile size
 
     # Second-stage classifier
     classify = False
@@ -48,132 +116,275 @@ def detect(save_img=False):
         modelc.load_state_dict(torch.load('weights/resnet101.pt', map_location=device)['model']).to(device).eval()
 
     # Set Dataloader
-    vid_path, vid_writer = None, None
+    timer = StageTimer() if opt.timing else None
+    sinks = [DetectionSink(save_dir / f'detections.{fmt}', fmt) for fmt in opt.save_format]
+    vid_path, writer = None, ResultWriter(timer=timer, sinks=sinks)
+    progress = ProgressStream(opt.progress_fd, opt.progress_interval) if opt.progress_fd >= 0 else None
     if webcam:
         view_img = check_imshow()
         cudnn.benchmark = True  # set True to speed up constant image size inference
         dataset = LoadStreams(source, img_size=imgsz, stride=stride)
+    elif opt.batch_size > 1:
+        dataset = LoadImageBatches(source, img_size=imgsz, stride=stride, batch_size=opt.batch_size,
+                                   **video_kwargs(opt))
     else:
-        dataset = LoadImages(source, img_size=imgsz, stride=stride)
+        dataset = LoadImages(source, img_size=imgsz, stride=stride, reuse_buffer=not opt.workers,
+                             **video_kwargs(opt))
+    dataset.timer = timer
+    inputs = InputBuffer(device, half)
+    if opt.workers and not webcam:
+        dataset = PrefetchLoader(dataset, workers=opt.workers, processes=opt.process_workers)
 
     # Get names and colors
     names = model.module.names if hasattr(model, 'module') else model.names
     colors = [[random.randint(0, 255) for _ in range(3)] for _ in names]
+    nms_conf = min(opt.conf_thres, opt.raw_conf_thres) if opt.raw_conf_thres else opt.conf_thres
 
     # Run inference
     if device.type != 'cpu':
         model(torch.zeros(1, 3, imgsz, imgsz).to(device).type_as(next(model.parameters())))  # run once
     old_img_w = old_img_h = imgsz
     old_img_b = 1
+    gate = MotionGate(opt.motion_thres, opt.motion_refresh) if opt.motion_thres else None
+    last_det = {}  # source: detections of the last inferred frame, for --motion-thres
+    trackers = {}  # source: Tracker, for --track
+    n_frames = 0  # video/stream batches seen, for --detect-every
+    cache = DetectionCache(opt.cache, opt.cache_size) if opt.cache and not getattr(model, 'end2end', False) else None
+    weights_hash = file_hash(weights) if cache else ''
 
-    t0 = time.time()
-    for path, img, im0s, vid_cap in dataset:
-        img = torch.from_numpy(img).to(device)
-        img = img.half() if half else img.float()  # uint8 to fp16/32
-        img /= 255.0  # 0 - 255 to 0.0 - 1.0
-        if img.ndimension() == 3:
-            img = img.unsqueeze(0)
-
-        # Warmup
-        if device.type != 'cpu' and (old_img_b != img.shape[0] or old_img_h != img.shape[2] or old_img_w != img.shape[3]):
-            old_img_b = img.shape[0]
-            old_img_h = img.shape[2]
-            old_img_w = img.shape[3]
-            for i in range(3):
-                model(img, augment=opt.augment)[0]
-
-        # Inference
-        t1 = time_synchronized()
-        with torch.no_grad():   # Calculating gradients would cause a GPU memory leak
-            pred = model(img, augment=opt.augment)[0]
-        t2 = time_synchronized()
-
-        # Apply NMS
-        pred = non_max_suppression(pred, opt.conf_thres, opt.iou_thres, classes=opt.classes, agnostic=opt.agnostic_nms)
-        t3 = time_synchronized()
-
-        # Apply Classifier
-        if classify:
-            pred = apply_classifier(pred, modelc, img, im0s)
-
-        # Process detections
-        for i, det in enumerate(pred):  # detections per image
-            if webcam:  # batch_size >= 1
-                p, s, im0, frame = path[i], '%g: ' % i, im0s[i].copy(), dataset.count
+    t0 = t_wait = time.time()
+    ok = False
+    try:
+        for path, img, im0s, vid_cap in dataset:
+            if timer:
+                timer.add('wait', (time.time() - t_wait) * 1E3)  # blocked on the dataloader
+            # Detection schedule and motion gate, video/stream frames in between are tracked or reuse previous
+            # detections
+            keys = path if isinstance(im0s, list) else [path]  # sources
+            video = dataset.mode != 'image'
+            track = opt.track and video
+            infer = not track or n_frames % opt.detect_every == 0
+            if infer and gate and video:
+                with stage(timer, 'gate'):
+                    infer = gate(keys, im0s if isinstance(im0s, list) else [im0s])
+            n_frames += video
+
+            # Cached candidates of images seen before with the same weights and img_size
+            cached = None
+            if cache and infer and not video:
+                with stage(timer, 'cache'):
+                    cache_keys = [cache.key(f, weights_hash, imgsz, opt.augment) for f in keys]
+                    cached = [cache.get(k) for k in cache_keys]
+                cached = cached if all(x is not None for x in cached) else None
+
+            if not infer:
+                pred = [None] * len(keys)
+            elif cached:
+                shapes = [shape for _, shape in cached]
+                t1 = t2 = time_synchronized()
+                with stage(timer, 'nms'):
+                    pred = [non_max_suppression_batched(torch.from_numpy(x[None]).to(device), nms_conf, opt.iou_thres,
+                                                        classes=opt.classes, agnostic=opt.agnostic_nms)[0]
+                            for x, _ in cached]
+                t3 = time_synchronized()
             else:
-                p, s, im0, frame = path, '', im0s, getattr(dataset, 'frame', 0)
-
-            p = Path(p)  # to Path
-            save_path = str(save_dir / p.name)  # img.jpg
-            txt_path = str(save_dir / 'labels' / p.stem) + ('' if dataset.mode == 'image' else f'_{frame}')  # img.txt
-            gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
-            if len(det):
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0.shape).round()
-
-                # Print results
-                for c in det[:, -1].unique():
-                    n = (det[:, -1] == c).sum()  # detections per class
-                    s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
-
-                # Write results
-                for *xyxy, conf, cls in reversed(det):
-                    if save_txt:  # Write to file
-                        xywh = (xyxy2xywh(torch.tensor(xyxy).view(1, 4)) / gn).view(-1).tolist()  # normalized xywh
-                        line = (cls, *xywh, conf) if opt.save_conf else (cls, *xywh)  # label format
-                        with open(txt_path + '.txt', 'a') as f:
-                            f.write(('%g ' * len(line)).rstrip() % line + '\n')
-
-                    if save_img or view_img:  # Add bbox to image
-                        label = f'{names[int(cls)]} {conf:.2f}'
-                        plot_one_box(xyxy, im0, label=label, color=colors[int(cls)], line_thickness=1)
-
-            # Print time (inference + NMS)
-            print(f'{s}Done. ({(1E3 * (t2 - t1)):.1f}ms) Inference, ({(1E3 * (t3 - t2)):.1f}ms) NMS')
-
-            # Stream results
-            if view_img:
-                cv2.imshow(str(p), im0)
-                cv2.waitKey(1)  # 1 millisecond
-
-            # Save results (image with detections)
-            if save_img:
-                if dataset.mode == 'image':
-                    cv2.imwrite(save_path, im0)
-                    print(f" The image with the result is saved in: {save_path}")
-                else:  # 'video' or 'stream'
-                    if vid_path != save_path:  # new video
-                        vid_path = save_path
-                        if isinstance(vid_writer, cv2.VideoWriter):
-                            vid_writer.release()  # release previous video writer
-                        if vid_cap:  # video
-                            fps = vid_cap.get(cv2.CAP_PROP_FPS)
-                            w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                            h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                        else:  # stream
-                            fps, w, h = 30, im0.shape[1], im0.shape[0]
-                            save_path += '.mp4'
-                        vid_writer = cv2.VideoWriter(save_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
-                    vid_writer.write(im0)
+                with stage(timer, 'h2d'):
+                    img = inputs(img)  # uint8 to fp16/32 0.0 - 1.0
+
+                # Warmup
+                if device.type != 'cpu' and (old_img_b != img.shape[0] or old_img_h != img.shape[2] or old_img_w != img.shape[3]):
+                    old_img_b = img.shape[0]
+                    old_img_h = img.shape[2]
+                    old_img_w = img.shape[3]
+                    for i in range(3):
+                        model(img, augment=opt.augment)[0]
+
+                # Inference
+                t1 = time_synchronized()
+                with torch.no_grad(), stage(timer, 'forward'):   # Calculating gradients would cause a GPU memory leak
+                    pred = model(img, augment=opt.augment)[0]
+                t2 = time_synchronized()
+                shapes = [img.shape[2:]] * len(keys)  # letterboxed input hw per image
+                if cache and not video:
+                    with stage(timer, 'cache'):
+                        for k, x in zip(cache_keys, pred.float().cpu().numpy()):
+                            cache.put(k, x, shapes[0])
+
+                # Apply NMS
+                with stage(timer, 'nms'):
+                    if getattr(model, 'end2end', False):  # NMS done in the model
+                        pred = ORTModel.filter(pred, nms_conf, classes=opt.classes)
+                    else:
+                        pred = non_max_suppression_batched(pred, nms_conf, opt.iou_thres, classes=opt.classes,
+                                                           agnostic=opt.agnostic_nms)
+                t3 = time_synchronized()
+
+            # Apply Classifier
+            if classify and infer:
+                pred = apply_classifier(pred, modelc, img, im0s)
+
+            # Process detections
+            for i, det in enumerate(pred):  # detections per image
+                if webcam:  # batch_size >= 1
+                    p, s, im0, frame = path[i], '%g: ' % i, im0s[i].copy(), dataset.count
+                elif isinstance(im0s, list):  # image batch
+                    p, s, im0, frame = path[i], '', im0s[i], 0
+                else:
+                    p, s, im0, frame = path, '', im0s, getattr(dataset, 'frame', 0)
+
+                p = Path(p)  # to Path
+                save_path = str(save_dir / p.name)  # img.jpg
+                txt_path = str(save_dir / 'labels' / p.stem) + ('' if dataset.mode == 'image' else f'_{frame}')  # img.txt
+                gn = torch.tensor(im0.shape)[[1, 0, 1, 0]]  # normalization gain whwh
+                ids = None  # track ids
+                raw = None  # detections down to --raw-conf-thres
+                if det is not None:
+                    if len(det):
+                        # Rescale boxes from img_size to im0 size
+                        with stage(timer, 'rescale'):
+                            det[:, :4] = scale_coords(shapes[i], det[:, :4], im0.shape).round()
+                    if opt.tile_size and max(im0.shape[:2]) > opt.tile_size:  # add native resolution tiles
+                        with stage(timer, 'tiles'):
+                            tiles = detect_tiles(model, im0, opt, device, half, nms_conf)
+                            det = torch.cat((det, tiles.round().type_as(det)), 0)
+                            det = merge_detections(det, opt.iou_thres, opt.agnostic_nms, merge=opt.tile_merge)
+                    if opt.raw_conf_thres:  # low confidence detections go to on_frame only
+                        raw, det = det, det[det[:, 4] >= opt.conf_thres]
+                    if gate and not track:
+                        last_det[keys[i]] = det.clone()
+                if track:  # persistent ids, boxes propagated by the tracker on frames without detections
+                    with stage(timer, 'track'):
+                        tracker = trackers.setdefault(keys[i], Tracker())
+                        t = tracker.step() if det is None else tracker.update(det.cpu().float().numpy())
+                        det, ids = torch.from_numpy(t[:, :6]).float().to(device), t[:, 6].astype(int).tolist()
+                elif det is None:  # no motion, previous detections of this source
+                    det = last_det[keys[i]].clone()
+                if len(det):
+                    # Print results
+                    for c in det[:, -1].unique():
+                        n = (det[:, -1] == c).sum()  # detections per class
+                        s += f"{n} {names[int(c)]}{'s' * (n > 1)}, "  # add to string
+
+                    # Write results
+                    if save_txt:  # Write to file, all lines of this image at once
+                        with stage(timer, 'labels'):
+                            xywhn = (xyxy2xywh(det[:, :4].cpu()) / gn).tolist()  # normalized xywh
+                            lines = []
+                            for j, (xywh, (conf, cls)) in reversed(list(enumerate(zip(xywhn, det[:, 4:6].tolist())))):
+                                line = (cls, *xywh, conf) if opt.save_conf else (cls, *xywh)  # label format
+                                line += (ids[j],) if ids is not None else ()  # track id last
+                                lines.append(('%g ' * len(line)).rstrip() % line + '\n')
+                            writer.write_labels(txt_path + '.txt', lines)
+
+                    if save_img or view_img or on_frame:  # Add bbox to image
+                        with stage(timer, 'draw'):
+                            for j, (*xyxy, conf, cls) in reversed(list(enumerate(det))):
+                                label = f'{names[int(cls)]} {conf:.2f}'
+                                label = f'{ids[j]} {label}' if ids is not None else label
+                                plot_one_box(xyxy, im0, label=label, color=colors[int(cls)], line_thickness=1)
+
+                # Print time (inference + NMS)
+                if infer:
+                    print(f"{s}Done. ({'cached' if cached else f'{1E3 * (t2 - t1):.1f}ms'}) Inference, "
+                          f"({(1E3 * (t3 - t2)):.1f}ms) NMS")
+                else:
+                    print(f"{s}Done. ({'tracked' if track else 'no motion, previous detections'})")
+
+                # Stream results
+                if progress:
+                    progress.update(str(p), frame, getattr(dataset, 'nframes', 0),
+                                    dataset.progress() if hasattr(dataset, 'progress') else 0., det, names)
+                if on_frame:
+                    on_frame(im0, det, {'path': str(p), 'frame': frame, 'nframes': getattr(dataset, 'nframes', 0),
+                                        'progress': dataset.progress() if hasattr(dataset, 'progress') else 0.,
+                                        'detections': len(det), 'summary': s.rstrip(', '), 'names': names,
+                                        'raw': (det if raw is None else raw).cpu().numpy()})
+                if view_img:
+                    cv2.imshow(str(p), im0)
+                    cv2.waitKey(1)  # 1 millisecond
+
+                # Save results (image with detections)
+                if save_img:
+                    if dataset.mode == 'image':
+                        writer.write_image(save_path, im0)
+                        print(f" The image with the result is saved in: {save_path}")
+                    else:  # 'video' or 'stream'
+                        if vid_path != save_path:  # new video
+                            vid_path = save_path
+                            if vid_cap:  # video
+                                fps = vid_cap.get(cv2.CAP_PROP_FPS)
+                                w = int(vid_cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                                h = int(vid_cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                            else:  # stream
+                                fps, w, h = 30, im0.shape[1], im0.shape[0]
+                                save_path += '.mp4'
+                            writer.new_video(save_path, fps, w, h)
+                        writer.write_frame(im0)
+                if sinks:
+                    writer.write_detections(str(p), frame, det.cpu().numpy(), ids)
+                if on_done:
+                    writer.call(on_done, str(p), det.cpu())
+
+            if timer:
+                timer.add('frame', (time.time() - t_wait) * 1E3)  # loop iteration, including wait
+                if opt.timing_interval:
+                    timer.dump(save_dir / 'timing.json', opt.timing_interval)
+            t_wait = time.time()
+        ok = True
+    finally:  # also on errors and on_frame/on_done raising to cancel the job
+        writer.close()  # flush results, finish the video file
+        if progress:
+            progress.close(done=ok)
+        if hasattr(dataset, 'close'):
+            dataset.close()  # stop decoder and prefetch threads
 
     if save_txt or save_img:
         s = f"\n{len(list(save_dir.glob('labels/*.txt')))} labels saved to {save_dir / 'labels'}" if save_txt else ''
         #print(f"Results saved to {save_dir}{s}")
 
+    if isinstance(dataset, PrefetchLoader):
+        print(f'Prefetch: {dataset.prefetcher.summary()}')
+    if webcam:
+        print(f'Streams: {dataset.summary()}')
+    if gate:
+        print(f'Motion gate: {gate.summary()}')
+    if cache:
+        print(f'Cache: {cache.summary()}')
+    print(f'Writer: {writer.summary()}')
+    if timer:
+        timer.print()
+        timer.save(save_dir / 'timing.json')
+        timer.save(save_dir / 'timing.csv')
     print(f'Done. ({time.time() - t0:.3f}s)')
 
 
-if __name__ == '__main__':
+def parse_opt(args=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--weights', nargs='+', type=str, default='yolov7.pt', help='model.pt path(s)')
     parser.add_argument('--source', type=str, default='inference/images', help='source')  # file/folder, 0 for webcam
     parser.add_argument('--img-size', type=int, default=640, help='inference size (pixels)')
+    parser.add_argument('--batch-size', type=int, default=1, help='images per forward pass for image folders')
+    parser.add_argument('--workers', type=int, default=0, help='decode/letterbox workers running ahead of inference')
+    parser.add_argument('--process-workers', action='store_true', help='use processes instead of threads for --workers')
+    parser.add_argument('--vid-stride', type=int, default=1, help='video frame-rate stride, read every N-th frame')
+    parser.add_argument('--start', type=float, default=0, help='video start time (seconds)')
+    parser.add_argument('--end', type=float, default=None, help='video end time (seconds), default until the end')
+    parser.add_argument('--video-backend', default='cv2', choices=['cv2', 'pyav'], help='video decoder, pyav is threaded')
+    parser.add_argument('--tile-size', type=int, default=0, help='also run native resolution tiles of this size, 0 to disable')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='tile overlap fraction')
+    parser.add_argument('--tile-batch', type=int, default=8, help='tiles per forward pass')
+    parser.add_argument('--tile-merge', action='store_true', help='merge duplicate boxes across tiles by weighted mean')
     parser.add_argument('--conf-thres', type=float, default=0.25, help='object confidence threshold')
     parser.add_argument('--iou-thres', type=float, default=0.45, help='IOU threshold for NMS')
+    parser.add_argument('--raw-conf-thres', type=float, default=0, help='also pass detections down to this threshold '
+                                                                         'to on_frame, 0 to disable')
     parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    parser.add_argument('--threads', type=int, default=0, help='torch intra-op threads, 0 for default')
     parser.add_argument('--view-img', action='store_true', help='display results')
     parser.add_argument('--save-txt', action='store_true', help='save results to *.txt')
     parser.add_argument('--save-conf', action='store_true', help='save confidences in --save-txt labels')
+    parser.add_argument('--save-format', nargs='*', default=[], choices=['jsonl', 'parquet', 'npz'],
+                        help='also save all detections to detections.jsonl/parquet/npz')
     parser.add_argument('--nosave', action='store_true', help='do not save images/videos')
     parser.add_argument('--classes', nargs='+', type=int, help='filter by class: --class 0, or --class 0 2 3')
     parser.add_argument('--agnostic-nms', action='store_true', help='class-agnostic NMS')
@@ -183,14 +394,33 @@ if __name__ == '__main__':
     parser.add_argument('--name', default='exp', help='save results to project/name')
     parser.add_argument('--exist-ok', action='store_true', help='existing project/name ok, do not increment')
     parser.add_argument('--no-trace', action='store_true', help='don`t trace model')
-    opt = parser.parse_args()
+    parser.add_argument('--motion-thres', type=float, default=0,
+                        help='reuse previous video/stream detections below this changed pixel fraction, 0 to disable')
+    parser.add_argument('--motion-refresh', type=int, default=30, help='run inference at least every N frames')
+    parser.add_argument('--track', action='store_true', help='track video/stream objects, ids are written last in labels')
+    parser.add_argument('--detect-every', type=int, default=1, help='with --track, run detection every N frames')
+    parser.add_argument('--cache', default='', help='detection cache dir to reuse model outputs of seen images')
+    parser.add_argument('--cache-size', type=float, default=2.0, help='detection cache size limit (GB)')
+    parser.add_argument('--timing', action='store_true', help='per-stage latency percentiles, saved to timing.json/csv')
+    parser.add_argument('--timing-interval', type=float, default=0, help='also save timing.json every N seconds')
+    parser.add_argument('--progress-fd', type=int, default=-1, help='write JSON lines progress to this fd, 2 for stderr')
+    parser.add_argument('--progress-interval', type=float, default=0.5, help='seconds between progress lines')
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnxruntime'], help='inference backend')
+    parser.add_argument('--intra-threads', type=int, default=0, help='onnxruntime intra-op threads, 0 for default')
+    parser.add_argument('--inter-threads', type=int, default=0, help='onnxruntime inter-op threads, 0 for default')
+    parser.add_argument('--trace-cache', default='runs/traced', help='traced model cache dir, empty to disable')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    opt = parse_opt()
     print(opt)
     #check_requirements(exclude=('pycocotools', 'thop'))
 
     with torch.no_grad():
         if opt.update:  # update all models (to fix SourceChangeWarning)
             for opt.weights in ['yolov7.pt']:
-                detect()
+                detect(opt)
                 strip_optimizer(opt.weights)
         else:
-            detect()
+            detect(opt)
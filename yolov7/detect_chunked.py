@@ -0,0 +1,159 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+from utils.general import increment_path
+
+FILE = Path(__file__).absolute()
+
+
+def chunk_ranges(nframes, chunks, vid_stride=1):
+    # Split frames [0, nframes) into up to chunks contiguous [start, end) ranges starting on vid_stride multiples
+    n = -(-nframes // vid_stride)  # frames read
+    bounds = sorted({round(i * n / chunks) * vid_stride for i in range(chunks)} | {nframes})
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if a < b]
+
+
+def concat_videos(files, f):
+    # Concatenate videos in order into f, by stream copy with ffmpeg when available, else by re-encoding with OpenCV
+    if shutil.which('ffmpeg'):
+        lst = Path(f).with_suffix('.txt')
+        lst.write_text(''.join(f"file '{Path(x).absolute()}'\n" for x in files))
+        r = subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', str(lst), '-c',
+                            'copy', str(f)])
+        lst.unlink()
+        if r.returncode == 0:
+            return
+    writer = None
+    for x in files:
+        cap = cv2.VideoCapture(str(x))
+        if writer is None:
+            fps, w, h = cap.get(cv2.CAP_PROP_FPS), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), \
+                int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            writer = cv2.VideoWriter(str(f), cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+        while True:
+            ok, im = cap.read()
+            if not ok:
+                break
+            writer.write(im)
+        cap.release()
+    if writer is not None:
+        writer.release()
+
+
+def merge_outputs(chunks, save_dir):
+    # Merge --save-format detections of chunk dirs in chunk order into save_dir, move --timing reports as
+    # timing_<chunk>.json/csv (percentiles do not combine); merged files are removed from the chunk dirs
+    jsonl = [f for f in (c / 'detections.jsonl' for c in chunks) if f.exists()]
+    if jsonl:
+        with open(save_dir / 'detections.jsonl', 'wb') as out:
+            for f in jsonl:
+                with open(f, 'rb') as x:
+                    shutil.copyfileobj(x, out)
+                f.unlink()
+
+    parquet = [f for f in (c / 'detections.parquet' for c in chunks) if f.exists()]
+    if parquet:
+        import pyarrow.parquet as pq  # chunks wrote parquet, so pyarrow is installed
+
+        writer = None
+        for f in parquet:
+            table = pq.read_table(f)
+            if writer is None:
+                writer = pq.ParquetWriter(save_dir / 'detections.parquet', table.schema)
+            writer.write_table(table)
+            f.unlink()
+        writer.close()
+
+    npz = [f for c in chunks for f in sorted(c.glob('detections_*.npz'), key=lambda x: int(x.stem.split('_')[-1]))]
+    for i, f in enumerate(npz):  # renumber parts continuously
+        f.replace(save_dir / f'detections_{i}.npz')
+
+    for i, c in enumerate(chunks):
+        for f in (c / 'timing.json', c / 'timing.csv'):
+            if f.exists():
+                f.replace(save_dir / f'timing_{i}{f.suffix}')
+
+
+def detect_chunked(opt, detect_args):
+    # Run detect.py on opt.chunks time ranges of one video in parallel processes, then merge their outputs
+    cap = cv2.VideoCapture(opt.source)
+    assert cap.isOpened(), f'Failed to open {opt.source}'
+    fps, nframes = cap.get(cv2.CAP_PROP_FPS) or 30, int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    assert nframes > 0, f'Unknown frame count of {opt.source}, chunking needs it'
+    ranges = chunk_ranges(nframes, opt.chunks, opt.vid_stride)
+    threads = opt.threads or max(os.cpu_count() // len(ranges), 1)
+    save_dir = Path(increment_path(Path(opt.project) / opt.name, exist_ok=opt.exist_ok))
+    chunk_dir = save_dir / 'chunks'
+    print(f'{opt.source}: {nframes} frames at {fps:.2f} FPS in {len(ranges)} chunks, {threads} threads each')
+
+    # Run chunks
+    t0, procs = time.time(), []
+    env = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+    chunk_dir.mkdir(parents=True, exist_ok=True)
+    for i, (a, b) in enumerate(ranges):
+        cmd = [sys.executable, str(FILE.parent / 'detect.py'), '--source', opt.source, '--start', repr(a / fps),
+               '--end', repr(b / fps), '--vid-stride', str(opt.vid_stride), '--threads', str(threads),
+               '--project', str(chunk_dir), '--name', str(i), '--exist-ok', *detect_args]
+        log = open(chunk_dir / f'{i}.log', 'w')
+        procs.append((subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env), log))
+    failed = []
+    for i, (p, log) in enumerate(procs):
+        if p.wait():
+            failed.append(i)
+        log.close()
+    assert not failed, f'chunks {failed} failed, see {chunk_dir}/<chunk>.log'
+    print(f'Chunks done. ({time.time() - t0:.3f}s)')
+
+    # Merge labels, file names already carry global frame numbers
+    chunks = [chunk_dir / str(i) for i in range(len(ranges))]
+    labels = [f for c in chunks for f in sorted((c / 'labels').glob('*.txt'))]
+    if labels:
+        (save_dir / 'labels').mkdir(parents=True, exist_ok=True)
+        for f in labels:
+            f.replace(save_dir / 'labels' / f.name)
+
+    # Concatenate videos in time order
+    videos = [c / Path(opt.source).name for c in chunks]
+    if all(f.exists() for f in videos):
+        concat_videos(videos, save_dir / Path(opt.source).name)
+        for f in videos:
+            f.unlink()
+    merge_outputs(chunks, save_dir)
+
+    # Chunk outputs left unmerged (other detect.py options) are kept rather than deleted
+    left = [f for c in chunks for f in c.rglob('*') if f.is_file()]
+    if left:
+        print(f'WARNING: {len(left)} chunk outputs not merged, kept in {chunk_dir}')
+    elif not opt.keep_chunks:
+        shutil.rmtree(chunk_dir)
+    print(f'Results saved to {save_dir}, {len(labels)} labels. ({time.time() - t0:.3f}s)')
+    return save_dir
+
+
+def parse_opt(args=None):
+    # Returns (opt, detect_args): chunking options and the remaining detect.py options passed to every chunk
+    parser = argparse.ArgumentParser(description='detect.py on one video split into chunks run in parallel, other '
+                                                 'options are passed to detect.py')
+    parser.add_argument('--source', type=str, required=True, help='video file')
+    parser.add_argument('--chunks', type=int, default=os.cpu_count() // 8 or 1, help='parallel detect.py processes')
+    parser.add_argument('--threads', type=int, default=0, help='torch threads per chunk, default cpu_count / chunks')
+    parser.add_argument('--vid-stride', type=int, default=1, help='video frame-rate stride, read every N-th frame')
+    parser.add_argument('--project', default='runs/detect', help='save results to project/name')
+    parser.add_argument('--name', default='exp', help='save results to project/name')
+    parser.add_argument('--exist-ok', action='store_true', help='existing project/name ok, do not increment')
+    parser.add_argument('--keep-chunks', action='store_true', help='keep per-chunk outputs and logs')
+    return parser.parse_known_args(args)
+
+
+if __name__ == '__main__':
+    opt, detect_args = parse_opt()
+    print(opt, detect_args)
+    detect_chunked(opt, detect_args)
@@ -0,0 +1,104 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import torch
+
+from detect import detect, parse_opt as parse_detect_opt
+from utils.datasets import img_formats, LoadImages
+from utils.torch_utils import file_hash
+
+PARAMS = ('img_size', 'conf_thres', 'iou_thres', 'classes', 'agnostic_nms', 'augment', 'tile_size', 'tile_overlap',
+          'tile_merge', 'save_conf', 'backend')  # detect.py options that change results
+
+
+class Manifest:
+    # Append-only JSONL record of processed files, one {"file", "key", ...} line per file flushed as it completes.
+    # A truncated last line from a crash is ignored on load
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()  # (file, key)
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        x = json.loads(line)
+                        self.done.add((x['file'], x['key']))
+                    except (ValueError, KeyError):
+                        pass
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.f = open(self.path, 'a')
+
+    def __contains__(self, item):
+        return item in self.done
+
+    def add(self, file, key, **info):
+        self.f.write(json.dumps({'file': file, 'key': key, 'time': round(time.time(), 3), **info}) + '\n')
+        self.f.flush()
+        self.done.add((file, key))
+
+    def close(self):
+        self.f.close()
+
+
+def job_key(opt):
+    # Identifies results of a file: hash of the weights contents and of the detect.py options that change results
+    params = json.dumps({k: getattr(opt, k) for k in PARAMS}, sort_keys=True)
+    return f'{file_hash(opt.weights)[:16]}-{hashlib.sha256(params.encode()).hexdigest()[:16]}'
+
+
+def in_shard(file, root, shard):
+    # True if file belongs to shard (i, n), by hash of its path relative to root so every machine agrees
+    i, n = shard
+    h = int(hashlib.md5(os.path.relpath(file, root).replace(os.sep, '/').encode()).hexdigest(), 16)
+    return h % n == i
+
+
+def run_job(opt, detect_opt):
+    # Run detect() on the images of opt.source not yet in the manifest for these weights and options
+    files = [f for f in LoadImages(opt.source).files if f.split('.')[-1].lower() in img_formats]
+    root = opt.source if os.path.isdir(opt.source) else os.path.dirname(os.path.commonprefix(files))
+    if opt.shard:
+        shard = tuple(int(x) for x in opt.shard.split('/'))
+        assert len(shard) == 2 and 0 <= shard[0] < shard[1], f'--shard {opt.shard} is not i/n with 0 <= i < n'
+        files = [f for f in files if in_shard(f, root, shard)]
+    detect_opt.exist_ok = True  # one run dir per job, reused on restart
+    save_dir = Path(detect_opt.project) / detect_opt.name
+    manifest = Manifest(opt.manifest or save_dir / 'manifest.jsonl')
+    key = job_key(detect_opt)
+    todo = [f for f in files if (f, key) not in manifest]
+    print(f'{opt.source}: {len(files)} images{f" in shard {opt.shard}" if opt.shard else ""}, '
+          f'{len(files) - len(todo)} done, {len(todo)} to do')
+
+    if todo:
+        if detect_opt.save_txt:  # labels are appended, drop partial ones left by an interrupted run
+            for f in todo:
+                (save_dir / 'labels' / (Path(f).stem + '.txt')).unlink(missing_ok=True)
+        detect_opt.source = todo
+        with torch.no_grad():
+            detect(detect_opt, on_done=lambda path, det: manifest.add(path, key, n=len(det)))
+    manifest.close()
+
+
+def parse_opt(args=None):
+    # Returns (opt, detect_opt): job options and detect.py options for the remaining arguments
+    parser = argparse.ArgumentParser(description='detect.py over large image collections with resume, other options '
+                                                 'are passed to detect.py')
+    parser.add_argument('--source', type=str, required=True, help='image folder, glob or file')
+    parser.add_argument('--manifest', type=str, default='', help='processed files JSONL, default <project>/<name>/'
+                                                                 'manifest.jsonl')
+    parser.add_argument('--shard', type=str, default='', help='i/n, process only shard i of n, by path hash')
+    parser.add_argument('--name', default='job', help='save results to project/name, reused on restart')
+    opt, rest = parser.parse_known_args(args)
+    detect_opt = parse_detect_opt(rest)
+    detect_opt.name = opt.name
+    return opt, detect_opt
+
+
+if __name__ == '__main__':
+    opt, detect_opt = parse_opt()
+    print(opt, detect_opt)
+    run_job(opt, detect_opt)
@@ -0,0 +1,78 @@
+import argparse
+import json
+import sys
+import traceback
+from threading import Lock
+
+import torch
+import torch.nn as nn
+
+from detect import detect, load_model, model_kwargs, parse_opt
+from utils.general import set_logging
+from utils.torch_utils import select_device
+
+
+def serialized(forward, lock):
+    # forward() running one call at a time: Detect heads cache their grids on the module, so concurrent calls with
+    # different input shapes would decode boxes on each other's grid
+    def locked_forward(*args, **kwargs):
+        with lock:
+            return forward(*args, **kwargs)
+    return locked_forward
+
+
+class DetectionWorker:
+    # Long-lived detector: keeps loaded models resident and runs detect() jobs read as JSON lines from a pipe
+    #   job example: {"weights": "yolov7.pt", "source": "data/example.jpg", "conf_thres": 0.5, "project": "runs/detect"}
+    #   job keys are detect.py options with '-' replaced by '_'
+    # run() may be called from several threads at once: they share the resident models, whose forward passes are
+    # serialized per model while loading, NMS, drawing and writing overlap
+    def __init__(self, device=''):
+        self.device = select_device(device)
+        self.models = {}  # (weights, load_model() kwargs): (model, imgsz)
+        self.lock = Lock()  # guards models, a model is loaded once
+
+    def model(self, opt):
+        # Return resident model for opt, loading it on first use
+        weights = opt.weights if isinstance(opt.weights, str) else tuple(opt.weights)
+        kwargs = model_kwargs(opt)
+        key = (weights, tuple(sorted(kwargs.items())))
+        with self.lock:
+            if key not in self.models:
+                print(f'Loading {weights}... ', flush=True)
+                model, imgsz = load_model(opt.weights, self.device, **kwargs)
+                if isinstance(model, nn.Module):  # onnxruntime sessions are thread safe
+                    model.forward = serialized(model.forward, Lock())
+                self.models[key] = model, imgsz
+            return self.models[key]
+
+    def run(self, job, **hooks):
+        # Run a single job dict, returns True on success. hooks are detect() callbacks, i.e. on_frame
+        opt = parse_opt([])  # detect.py defaults
+        for k, v in job.items():
+            assert hasattr(opt, k), f'unknown job option {k}'
+            setattr(opt, k, v)
+        with torch.no_grad():
+            detect(opt, model=self.model(opt), **hooks)
+        return True
+
+    def serve(self, stdin=sys.stdin):
+        # Read jobs until EOF, every job ends with a 'job done' or 'job failed' line
+        for line in stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                self.run(json.loads(line))
+                print('job done', flush=True)
+            except Exception:
+                traceback.print_exc(file=sys.stdout)
+                print('job failed', flush=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--device', default='', help='cuda device, i.e. 0 or 0,1,2,3 or cpu')
+    opt = parser.parse_args()
+    set_logging()
+    DetectionWorker(opt.device).serve()
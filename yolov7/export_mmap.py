@@ -0,0 +1,30 @@
+import argparse
+import os
+import time
+from pathlib import Path
+
+from models.experimental import attempt_load, export_mmap
+from utils.general import set_logging
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='yolov7.pt', help='model.pt path')
+    parser.add_argument('--output', type=str, default='', help='memory-mappable model path, default <weights>.mmap')
+    parser.add_argument('--half', action='store_true', help='store FP16 tensors, half the size of FP32')
+    opt = parser.parse_args()
+    print(opt)
+    set_logging()
+
+    t = time.time()
+    model = attempt_load(opt.weights, map_location='cpu')  # fused FP32 model
+    t_pt = time.time() - t
+    assert hasattr(model, 'yaml'), f'{opt.weights} is not a single yolo Model checkpoint'
+    if opt.half:
+        model.half()
+
+    f = export_mmap(model, opt.output or str(Path(opt.weights).with_suffix('.mmap')))
+    t = time.time()
+    attempt_load(f, map_location='cpu')
+    t_mmap = time.time() - t
+    print(f'Fused model saved to {f} ({os.path.getsize(f) / 1E6:.1f}MB), run detect.py --weights {f}')
+    print(f'Load time {t_pt:.2f}s {Path(opt.weights).suffix}, {t_mmap:.2f}s .mmap (warm page cache)')
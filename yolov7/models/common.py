@@ -14,6 +14,7 @@ from torch.cuda import amp
 
 from utils.datasets import letterbox
 from utils.general import non_max_suppression, make_divisible, scale_coords, increment_path, xyxy2xywh
+from utils.pipeline import Prefetcher
 from utils.plots import color_list, plot_one_box
 from utils.torch_utils import time_synchronized
 
@@ -867,6 +868,7 @@ class autoShape(nn.Module):
     conf = 0.25  # NMS confidence threshold
     iou = 0.45  # NMS IoU threshold
     classes = None  # (optional list) filter by class
+    workers = 4  # letterbox threads for multi-image inputs
 
     def __init__(self, model):
         super(autoShape, self).__init__()
@@ -912,7 +914,12 @@ class autoShape(nn.Module):
             shape1.append([y * g for y in s])
             imgs[i] = im  # update
         shape1 = [make_divisible(x, int(self.stride.max())) for x in np.stack(shape1, 0).max(0)]  # inference shape
-        x = [letterbox(im, new_shape=shape1, auto=False)[0] for im in imgs]  # pad
+        if n > 1 and self.workers:  # pad in a thread pool
+            x = Prefetcher(((i, letterbox, (im, shape1, (114, 114, 114), False)) for i, im in enumerate(imgs)),
+                           workers=self.workers)
+            x = [y[0] for _, y in x]
+        else:
+            x = [letterbox(im, new_shape=shape1, auto=False)[0] for im in imgs]  # pad
         x = np.stack(x, 0) if n > 1 else x[0][None]  # stack
         x = np.ascontiguousarray(x.transpose((0, 3, 1, 2)))  # BHWC to BCHW
         x = torch.from_numpy(x).to(p.device).type_as(p) / 255.  # uint8 to fp16/32
@@ -1,5 +1,9 @@
+import ast
+import json
+import os
 import numpy as np
 import random
+import struct
 import torch
 import torch.nn as nn
 
@@ -244,12 +248,156 @@ class End2End(nn.Module):
 
 
 
+class QuantizedModel(nn.Module):
+    '''INT8 backbone from post-training quantization with the float Detect() head, see quantize.py.'''
+    quantized = True
+
+    def __init__(self, model, detect_layer, stride, names):
+        super().__init__()
+        self.model = model  # quantized GraphModule returning the Detect() inputs
+        self.detect_layer = detect_layer
+        self.stride = stride
+        self.names = names
+
+    def forward(self, x, augment=False, profile=False):
+        return self.detect_layer(self.model(x))
+
+    def fuse(self):  # already fused before quantization
+        return self
+
+
+class ORTModel:
+    '''ONNX-Runtime inference session behaving like a loaded detection model in detect.py.'''
+    def __init__(self, weights, intra_threads=0, inter_threads=0, device=None):
+        import onnxruntime as ort  # optional dependency, only needed for --backend onnxruntime
+        device = device if device else torch.device('cpu')
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = intra_threads  # 0 lets ORT choose
+        so.inter_op_num_threads = inter_threads
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ['CUDAExecutionProvider', 'CPUExecutionProvider'] if device.type != 'cpu' else ['CPUExecutionProvider']
+        self.session = ort.InferenceSession(weights, so, providers=providers)
+        self.device = torch.device('cpu')  # inputs and outputs live on host
+        self.input = self.session.get_inputs()[0]
+        self.dtype = np.float16 if 'float16' in self.input.type else np.float32
+        outputs = self.session.get_outputs()
+        self.output_names = [o.name for o in outputs]
+        o = outputs[0].shape
+        self.end2end = len(outputs) == 1 and len(o) == 2 and o[-1] == 7  # ONNX_ORT NMS output (n,7), raw is (bs,n,5+nc)
+
+        # Fixed input height, width or None for dynamic axes
+        h, w = self.input.shape[2:]
+        self.img_size = (h, w) if isinstance(h, int) and isinstance(w, int) else None
+        self.batch_size = self.input.shape[0] if isinstance(self.input.shape[0], int) else None
+
+        # Model properties from export metadata, if any
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.stride = torch.tensor([float(meta.get('stride', 32))])
+        if 'names' in meta:
+            self.names = ast.literal_eval(meta['names'])
+        else:
+            nc = outputs[0].shape[-1] - 5 if not self.end2end and isinstance(outputs[0].shape[-1], int) else 80
+            self.names = [str(i) for i in range(nc)]
+
+    def __call__(self, x, augment=False):
+        # x(bs,3,h,w) tensor in 0-1, returns (pred, None) like Model.forward, pred is a list of (n,6) if end2end
+        if self.img_size and tuple(x.shape[2:]) != self.img_size:  # pad bottom-right, box coordinates stay valid
+            h, w = self.img_size
+            assert x.shape[2] <= h and x.shape[3] <= w, f'input {tuple(x.shape[2:])} larger than ONNX input {self.img_size}'
+            x = torch.nn.functional.pad(x, (0, w - x.shape[3], 0, h - x.shape[2]), value=114 / 255)
+        x = x.cpu().numpy().astype(self.dtype)
+        xs = [x[i:i + 1] for i in range(len(x))] if self.batch_size == 1 and len(x) > 1 else [x]
+        y = [self.session.run(self.output_names, {self.input.name: xi})[0] for xi in xs]
+        if not self.end2end:
+            return torch.from_numpy(np.concatenate(y, 0)).float(), None
+
+        # (n,7) [batch_id, x1, y1, x2, y2, cls, score] to per-image (n,6) [xyxy, conf, cls]
+        pred = []
+        for j, yi in enumerate(y):
+            yi = torch.from_numpy(yi).float()
+            for b in range(len(xs[j])):
+                d = yi[yi[:, 0] == b]
+                pred.append(torch.cat((d[:, 1:5], d[:, 6:7], d[:, 5:6]), 1))
+        return pred, None
+
+    @staticmethod
+    def filter(pred, conf_thres=0.25, classes=None):
+        # Applies conf_thres and class filter to end2end outputs that already went through NMS
+        out = []
+        for x in pred:
+            x = x[x[:, 4] > conf_thres]
+            if classes is not None:
+                x = x[(x[:, 5:6] == torch.tensor(classes)).any(1)]
+            out.append(x)
+        return out
+
+
+MMAP_MAGIC = b'YOLOMMAP'
+
+
+def export_mmap(model, f):
+    # Saves a fused Model as a memory-mappable file: magic, header length, header JSON (model yaml, names and tensor
+    # table), then the raw state_dict tensors at 64-byte aligned offsets
+    sd = {k: v.detach().cpu().contiguous().numpy() for k, v in model.state_dict().items()}
+    tensors, offset = {}, 0
+    for k, a in sd.items():
+        tensors[k] = {'dtype': a.dtype.str, 'shape': list(a.shape), 'offset': offset}
+        offset += -(-a.nbytes // 64) * 64
+    header = json.dumps({'yaml': model.yaml, 'names': list(model.names), 'tensors': tensors}).encode()
+    start = -(-(16 + len(header)) // 64) * 64  # data start
+
+    tmp = f'{f}.tmp'
+    with open(tmp, 'wb') as fo:
+        fo.write(MMAP_MAGIC + struct.pack('<Q', len(header)) + header)
+        for k, a in sd.items():
+            fo.seek(start + tensors[k]['offset'])
+            fo.write(a.tobytes())
+        fo.truncate(start + offset)
+    os.replace(tmp, f)  # atomic
+    return f
+
+
+def load_mmap(f, map_location=None):
+    # Loads a model saved by export_mmap(): builds the fused module from its yaml and maps the tensors from the file
+    # without reading or copying them (copy-on-write pages, torch>=2.1 assigns them in place)
+    from models.yolo import Model
+
+    with open(f, 'rb') as fi:
+        assert fi.read(8) == MMAP_MAGIC, f'{f} is not an export_mmap() file'
+        n = struct.unpack('<Q', fi.read(8))[0]
+        header = json.loads(fi.read(n))
+    start = -(-(16 + n) // 64) * 64
+    buf = np.memmap(f, dtype=np.uint8, mode='c')
+    sd = {}
+    for k, t in header['tensors'].items():
+        dtype = np.dtype(t['dtype'])
+        size = int(np.prod(t['shape'])) * dtype.itemsize
+        a = buf[start + t['offset']:start + t['offset'] + size]
+        sd[k] = torch.from_numpy(a.view(dtype).reshape(t['shape']))
+
+    model = Model(header['yaml']).fuse().eval()  # same modules as the exported fused model
+    model.names = header['names']
+    try:
+        model.load_state_dict(sd, assign=True)  # torch>=2.1, tensors stay mapped
+    except TypeError:
+        model.load_state_dict(sd)  # copy
+    if map_location is not None and torch.device(map_location).type != 'cpu':
+        model.to(map_location)
+    return model
+
+
 def attempt_load(weights, map_location=None):
     # Loads an ensemble of models weights=[a,b,c] or a single model weights=[a] or weights=a
     model = Ensemble()
     for w in weights if isinstance(weights, list) else [weights]:
+        if str(w).endswith('.mmap'):  # fused model from export_mmap()
+            model.append(load_mmap(w, map_location).float())  # no-op for FP32, tensors stay mapped
+            continue
         attempt_download(w)
         ckpt = torch.load(w, map_location=map_location)  # load
+        if ckpt.get('quantized'):  # INT8 model from quantize.py, CPU only
+            model.append(ckpt['model'].eval())
+            continue
         model.append(ckpt['ema' if ckpt.get('ema') else 'model'].float().fuse().eval())  # FP32 model
     
     # Compatibility updates
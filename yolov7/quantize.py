@@ -0,0 +1,144 @@
+import argparse
+import os
+import time
+from copy import deepcopy
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from models.experimental import attempt_load, QuantizedModel
+from utils.datasets import LoadImages, img2label_paths
+from utils.general import check_img_size, non_max_suppression, scale_coords, xywhn2xyxy, box_iou, set_logging
+from utils.metrics import ap_per_class
+
+
+class Backbone(nn.Module):
+    # Fused model up to, not including, the Detect() head; FX traces through Model.forward_once
+    def __init__(self, model):
+        super(Backbone, self).__init__()
+        self.model = model
+        self.model.traced = True  # forward_once stops at Detect() and returns its inputs
+
+    def forward(self, x):
+        return self.model.forward_once(x)
+
+
+def quantize(model, images, imgsz=640, n=100, backend='fbgemm'):
+    # FX static post-training quantization of the backbone calibrated on up to n images, returns QuantizedModel.
+    # Ops without INT8 kernels (e.g. SiLU) stay FP32 between dequant/quant pairs
+    from torch.ao.quantization import get_default_qconfig
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = backend
+    detect_layer = model.model[-1]
+    backbone = Backbone(deepcopy(model)).eval()
+    example = torch.rand(1, 3, imgsz, imgsz)
+    try:  # torch>=1.13
+        from torch.ao.quantization import get_default_qconfig_mapping
+        prepared = prepare_fx(backbone, get_default_qconfig_mapping(backend), (example,))
+    except ImportError:
+        prepared = prepare_fx(backbone, {'': get_default_qconfig(backend)})
+
+    # Calibrate
+    for i, (path, img, im0s, _) in enumerate(LoadImages(images, img_size=imgsz, stride=int(model.stride.max()))):
+        if i == n:
+            break
+        prepared(torch.from_numpy(img).float()[None] / 255.0)
+    print(f'Calibrated on {min(i + 1, n)} images')
+
+    return QuantizedModel(convert_fx(prepared).eval(), detect_layer, model.stride, model.names)
+
+
+def match(pred, target, iouv):
+    # Returns correct(n,len(iouv)) for pred(n,6) [xyxy, conf, cls] against target(m,5) [cls, xyxy]
+    correct = torch.zeros(pred.shape[0], len(iouv), dtype=torch.bool)
+    if not len(pred) or not len(target):
+        return correct
+    iou = box_iou(target[:, 1:], pred[:, :4])
+    for k, t in enumerate(iouv):
+        x = torch.where((iou >= t) & (target[:, 0:1] == pred[:, 5]))  # target, pred indices
+        if x[0].shape[0]:
+            matches = torch.cat((torch.stack(x, 1), iou[x[0], x[1]][:, None]), 1).numpy()  # [target, pred, iou]
+            if x[0].shape[0] > 1:
+                matches = matches[matches[:, 2].argsort()[::-1]]
+                matches = matches[np.unique(matches[:, 1], return_index=True)[1]]  # one target per pred
+                matches = matches[matches[:, 2].argsort()[::-1]]
+                matches = matches[np.unique(matches[:, 0], return_index=True)[1]]  # one pred per target
+            correct[matches[:, 1].astype(int), k] = True
+    return correct
+
+
+def evaluate(models, images, imgsz=640, conf_thres=0.25, n=100):
+    # mAP@0.5 and mAP@0.5:0.95 of models on up to n images and mean forward time in ms.
+    # Targets are the *.txt labels next to the images when present, else FP32 (models[0]) detections at conf_thres
+    iouv = torch.linspace(0.5, 0.95, 10)
+    stats, dt = [[] for _ in models], [0.] * len(models)
+    labelled = False
+    for i, (path, img, im0, _) in enumerate(LoadImages(images, img_size=imgsz, stride=int(models[0].stride.max()))):
+        if i == n:
+            break
+        img = torch.from_numpy(img).float()[None] / 255.0
+        preds = []
+        for j, m in enumerate(models):
+            t = time.time()
+            y = m(img)[0]
+            dt[j] += (time.time() - t) * 1E3
+            pred = non_max_suppression(y, 0.001, 0.65)[0]
+            pred[:, :4] = scale_coords(img.shape[2:], pred[:, :4], im0.shape)
+            preds.append(pred)
+
+        lb = img2label_paths([path])[0]
+        if os.path.isfile(lb):  # ground truth
+            labelled = True
+            l = torch.from_numpy(np.loadtxt(lb, ndmin=2).astype(np.float32)).reshape(-1, 5)
+            target = torch.cat((l[:, :1], xywhn2xyxy(l[:, 1:], w=im0.shape[1], h=im0.shape[0])), 1)
+        else:  # FP32 reference
+            r = preds[0][preds[0][:, 4] > conf_thres]
+            target = torch.cat((r[:, 5:6], r[:, :4]), 1)
+        for j, pred in enumerate(preds):
+            stats[j].append((match(pred, target, iouv), pred[:, 4], pred[:, 5], target[:, 0]))
+
+    results = []
+    for j in range(len(models)):
+        s = [torch.cat(x, 0).numpy() for x in zip(*stats[j])]
+        if len(s) and s[0].any():
+            ap = ap_per_class(*s)[2]
+            results.append((ap[:, 0].mean(), ap.mean(), dt[j] / min(i + 1, n)))
+        else:
+            results.append((0., 0., dt[j] / min(i + 1, n)))
+    return results, labelled
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--weights', type=str, default='yolov7.pt', help='FP32 model.pt path')
+    parser.add_argument('--calib', type=str, default='inference/images', help='representative images for calibration')
+    parser.add_argument('--val', type=str, default='', help='images (optionally with labels) for evaluation, default --calib')
+    parser.add_argument('--img-size', type=int, default=640, help='inference size (pixels)')
+    parser.add_argument('--calib-images', type=int, default=100, help='max images used for calibration')
+    parser.add_argument('--val-images', type=int, default=100, help='max images used for evaluation')
+    parser.add_argument('--conf-thres', type=float, default=0.25, help='FP32 reference confidence threshold')
+    parser.add_argument('--backend', default='fbgemm', choices=['fbgemm', 'qnnpack'], help='x86 or ARM kernels')
+    parser.add_argument('--output', type=str, default='', help='INT8 model path, default <weights>_int8.pt')
+    opt = parser.parse_args()
+    print(opt)
+    set_logging()
+
+    with torch.no_grad():
+        model = attempt_load(opt.weights, map_location='cpu')  # fused FP32 model
+        imgsz = check_img_size(opt.img_size, s=int(model.stride.max()))
+        qmodel = quantize(model, opt.calib, imgsz, opt.calib_images, opt.backend)
+
+        f = opt.output or str(Path(opt.weights).with_suffix('')) + '_int8.pt'
+        torch.save({'model': qmodel, 'quantized': True}, f)
+        print(f'INT8 model saved to {f} ({os.path.getsize(f) / 1E6:.1f}MB), run detect.py --weights {f} --device cpu')
+
+        ((m0, m0_95, t0), (q0, q0_95, t1)), labelled = evaluate([model, qmodel], opt.val or opt.calib, imgsz,
+                                                                opt.conf_thres, opt.val_images)
+        print(f"Evaluated against {'labels' if labelled else 'FP32 detections'}")
+        print(f"{'':>6}{'mAP@.5':>10}{'mAP@.5:.95':>12}{'ms/img':>10}")
+        print(f"{'FP32':>6}{m0:10.4g}{m0_95:12.4g}{t0:10.1f}")
+        print(f"{'INT8':>6}{q0:10.4g}{q0_95:12.4g}{t1:10.1f}")
+        print(f"{'delta':>6}{q0 - m0:10.4g}{q0_95 - m0_95:12.4g}{t1 - t0:10.1f}  ({t0 / max(t1, 1E-9):.2f}x speedup)")
@@ -0,0 +1,62 @@
+# Detection cache utils
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+from utils.torch_utils import file_hash
+
+
+class DetectionCache:
+    # Persistent cache of pre-NMS detection candidates keyed by (image content, weights, img_size, augment), so runs
+    # that only change conf_thres, iou_thres or classes redo NMS from the cache instead of running the model.
+    # Candidates with objectness below floor are not stored, lower conf_thres than floor see fewer boxes.
+    # Entries are *.npz files, least recently used ones are deleted once the cache exceeds max_size GB
+    def __init__(self, path='runs/cache', max_size=2.0, floor=0.001):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size, self.floor = max_size * 1E9, floor
+        self.size = sum(f.stat().st_size for f in self.path.glob('*.npz'))
+        self.hits = self.misses = 0
+
+    def key(self, file, weights_hash, img_size, augment=False):
+        s = f'{file_hash(file)}:{weights_hash}:{img_size}:{bool(augment)}'
+        return hashlib.sha256(s.encode()).hexdigest()
+
+    def get(self, key):
+        # Returns (candidates(n,no) numpy, letterboxed input hw shape) or None
+        f = self.path / f'{key}.npz'
+        try:
+            with np.load(f) as x:
+                x = x['pred'], tuple(x['shape'])
+            os.utime(f)  # most recently used
+            self.hits += 1
+            return x
+        except (OSError, KeyError, ValueError):  # missing or partially written
+            self.misses += 1
+            return None
+
+    def put(self, key, pred, shape):
+        # Store candidates pred(n,no) of an image letterboxed to shape hw
+        f = self.path / f'{key}.npz'
+        tmp = f.with_suffix(f'.{os.getpid()}.tmp.npz')
+        np.savez_compressed(tmp, pred=pred[pred[:, 4] > self.floor].astype(np.float32), shape=np.array(shape))
+        os.replace(tmp, f)  # atomic
+        self.size += f.stat().st_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        # Delete least recently used entries down to 90% of max_size
+        files = sorted(((x.stat(), x) for x in self.path.glob('*.npz')), key=lambda x: x[0].st_mtime)
+        self.size = sum(s.st_size for s, _ in files)
+        for s, x in files:
+            if self.size <= 0.9 * self.max_size:
+                break
+            x.unlink(missing_ok=True)
+            self.size -= s.st_size
+
+    def summary(self):
+        return f'{self.hits} hits, {self.misses} misses, {self.size / 1E6:.1f}MB'
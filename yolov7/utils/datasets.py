@@ -10,7 +10,8 @@ import time
 from itertools import repeat
 from multiprocessing.pool import ThreadPool
 from pathlib import Path
-from threading import Thread
+from queue import Queue, Full
+from threading import Condition, Event, Thread
 
 import cv2
 import numpy as np
@@ -28,6 +29,8 @@ from torchvision.ops import roi_pool, roi_align, ps_roi_pool, ps_roi_align
 
 from utils.general import check_requirements, xyxy2xywh, xywh2xyxy, xywhn2xyxy, xyn2xy, segment2box, segments2boxes, \
     resample_segments, clean_str
+from utils.pipeline import Prefetcher
+from utils.timing import stage
 from utils.torch_utils import torch_distributed_zero_first
 
 # Parameters
@@ -125,10 +128,140 @@ class _RepeatSampler(object):
             yield from iter(self.sampler)
 
 
+class VideoReader:  # for inference
+    # cv2.VideoCapture-like video reader decoding on a background thread, with OpenCV or PyAV (multi-threaded codec).
+    # Reads every vid_stride-th frame between start and end seconds; skipped frames are decoded but never converted.
+    # .frame is the 1-based source frame number of the last frame read, so chunks of a video keep global numbers;
+    # .nframes counts the whole file, .frames the frames read() returns for the range and stride (0 if unknown)
+    def __init__(self, path, vid_stride=1, start=0., end=None, backend='cv2', threads=0, buffer=8):
+        self.path, self.vid_stride, self.backend, self.threads, self.buffer = path, max(vid_stride, 1), backend, \
+            threads, buffer
+        if backend == 'pyav':
+            import av  # optional, pip install av
+            container = av.open(path)
+            s = container.streams.video[0]
+            self.fps = float(s.average_rate or 30)
+            self.w, self.h = s.codec_context.width, s.codec_context.height
+            self.nframes = s.frames or int(float(s.duration * s.time_base) * self.fps if s.duration else 0)
+            container.close()
+        else:
+            cap = cv2.VideoCapture(path)
+            assert cap.isOpened(), f'Failed to open {path}'
+            self.fps = cap.get(cv2.CAP_PROP_FPS) or 30
+            self.w, self.h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.nframes = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+        self.end = round(end * self.fps) if end is not None else float('inf')  # 0-based frame index, exclusive
+        self.thread, self.done = None, False
+        self.seek(start)
+
+    def seek(self, t):
+        # Restart decoding at the first frame at or after t seconds, the decoder thread starts on the next read()
+        self.release()
+        self.first = max(round(t * self.fps), 0)  # 0-based frame index
+        self.frame, self.done = self.first, False
+        last = min(self.end, self.nframes or float('inf'))  # 0-based frame index, exclusive
+        self.frames = max(-(-(last - self.first) // self.vid_stride), 0) if last < float('inf') else 0
+
+    def fraction(self, frame):
+        # Fraction of the range read up to and including 1-based source frame number frame, 0 if frames is unknown
+        if not self.frames:
+            return 0.
+        return min(max((frame - 1 - self.first) // self.vid_stride + 1, 0) / self.frames, 1.)
+
+    def put(self, item):
+        # Queue item unless released, returns False to stop decoding
+        while not self.stop:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def decode_cv2(self):
+        cap = cv2.VideoCapture(self.path)
+        try:
+            if self.first:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, self.first)
+            i = int(cap.get(cv2.CAP_PROP_POS_FRAMES))  # actual position, may differ from a requested inexact seek
+            while i < self.end:
+                if (i - self.first) % self.vid_stride or i < self.first:
+                    ok = cap.grab()  # decode only
+                else:
+                    ok, im = cap.read()
+                    ok = ok and self.put((i + 1, im))
+                if not ok:
+                    break
+                i += 1
+        finally:
+            cap.release()
+            self.put(None)
+
+    def decode_pyav(self):
+        import av
+        container = av.open(self.path)
+        try:
+            s = container.streams.video[0]
+            s.thread_type = 'AUTO'  # frame and slice threading
+            s.codec_context.thread_count = self.threads
+            tb = float(s.time_base)
+            t0 = float(s.start_time * s.time_base) if s.start_time is not None else 0.
+            if self.first:
+                container.seek(int((t0 + self.first / self.fps) / tb), stream=s)  # keyframe before first
+            i = self.first - 1
+            for f in container.decode(s):
+                i = round((float(f.pts * tb) - t0) * self.fps) if f.pts is not None else i + 1  # 0-based index
+                if i >= self.end:
+                    break
+                if i < self.first or (i - self.first) % self.vid_stride:
+                    continue  # decoded, not converted
+                if not self.put((i + 1, f.to_ndarray(format='bgr24'))):
+                    break
+        finally:
+            container.close()
+            self.put(None)
+
+    def read(self):
+        if self.done:
+            return False, None
+        if self.thread is None:
+            self.queue, self.stop = Queue(self.buffer), False
+            self.thread = Thread(target=self.decode_pyav if self.backend == 'pyav' else self.decode_cv2, daemon=True)
+            self.thread.start()
+        x = self.queue.get()
+        if x is None:  # end of range or stream
+            self.release()
+            self.done = True
+            return False, None
+        self.frame, im = x
+        return True, im
+
+    def get(self, prop):
+        # cv2.VideoCapture.get() for the properties detect.py uses; fps is the output rate after vid_stride
+        return {cv2.CAP_PROP_FPS: self.fps / self.vid_stride,
+                cv2.CAP_PROP_FRAME_WIDTH: self.w,
+                cv2.CAP_PROP_FRAME_HEIGHT: self.h,
+                cv2.CAP_PROP_FRAME_COUNT: self.nframes,
+                cv2.CAP_PROP_POS_FRAMES: self.frame}.get(prop, 0)
+
+    def isOpened(self):
+        return not self.done
+
+    def release(self):
+        if self.thread:
+            self.stop = True
+            self.thread.join()
+            self.thread = None
+
+
 class LoadImages:  # for inference
-    def __init__(self, path, img_size=640, stride=32):
-        p = str(Path(path).absolute())  # os-agnostic absolute path
-        if '*' in p:
+    def __init__(self, path, img_size=640, stride=32, vid_stride=1, start=0., end=None, video_backend='cv2',
+                 reuse_buffer=False):
+        p = f'{len(path)} files' if isinstance(path, (list, tuple)) else str(Path(path).absolute())  # os-agnostic path
+        if isinstance(path, (list, tuple)):
+            files = [str(Path(x).absolute()) for x in path]  # file list, in order
+        elif '*' in p:
             files = sorted(glob.glob(p, recursive=True))  # glob
         elif os.path.isdir(p):
             files = sorted(glob.glob(os.path.join(p, '*.*')))  # dir
@@ -143,10 +276,15 @@ class LoadImages:  # for inference
 
         self.img_size = img_size
         self.stride = stride
+        self.video = dict(vid_stride=vid_stride, start=start, end=end, backend=video_backend)  # VideoReader kwargs
         self.files = images + videos
         self.nf = ni + nv  # number of files
         self.video_flag = [False] * ni + [True] * nv
         self.mode = 'image'
+        self.timer = None  # optional StageTimer, records 'decode' and 'letterbox'
+        self.count = self.frame = self.nframes = 0
+        # img yielded by __next__ is overwritten by the next one with reuse_buffer, jobs() always returns new arrays
+        self.buffer = LetterboxBuffer(img_size, stride) if reuse_buffer else None
         if any(videos):
             self.new_video(videos[0])  # new video
         else:
@@ -166,7 +304,8 @@ class LoadImages:  # for inference
         if self.video_flag[self.count]:
             # Read video
             self.mode = 'video'
-            ret_val, img0 = self.cap.read()
+            with stage(self.timer, 'decode'):
+                ret_val, img0 = self.cap.read()
             if not ret_val:
                 self.count += 1
                 self.cap.release()
@@ -175,34 +314,209 @@ class LoadImages:  # for inference
                 else:
                     path = self.files[self.count]
                     self.new_video(path)
-                    ret_val, img0 = self.cap.read()
+                    with stage(self.timer, 'decode'):
+                        ret_val, img0 = self.cap.read()
 
-            self.frame += 1
+            self.frame = self.cap.frame
             print(f'video {self.count + 1}/{self.nf} ({self.frame}/{self.nframes}) {path}: ', end='')
 
         else:
             # Read image
             self.count += 1
-            img0 = cv2.imread(path)  # BGR
-            assert img0 is not None, 'Image Not Found ' + path
+            img0 = path
             #print(f'image {self.count}/{self.nf} {path}: ', end='')
 
+        # Padded resize and convert
+        img, img0 = load_letterboxed(img0, self.img_size, self.stride, self.timer, self.buffer)
+
+        return path, img, img0, self.cap
+
+    def new_video(self, path):
+        self.frame = 0
+        self.cap = VideoReader(path, **self.video)
+        self.nframes = self.cap.nframes
+
+    def progress(self):
+        # Fraction of the files done, the current video counts by the frames read of its range
+        return file_progress(self.count, self.nf, self.mode, self.cap.fraction(self.frame) if self.cap else 0.)
+
+    def close(self):
+        # Stop the video decoder thread, i.e. when iteration ends early
+        if self.cap:
+            self.cap.release()
+
+    def jobs(self, start=0):
+        # Yields ((path, cap, frame, mode, msg), fn, args) work items from file index start for PrefetchLoader.
+        # Videos are decoded here, in order; fn(*args) -> (img, img0) does the rest and may run in a pool
+        for i in range(start, self.nf):
+            path = self.files[i]
+            if not self.video_flag[i]:
+                yield (path, None, 0, 'image', ''), load_letterboxed, (path, self.img_size, self.stride, self.timer)
+                continue
+            cap = VideoReader(path, **self.video)  # the consumer may still query it for fps/size after release
+            nframes = cap.nframes
+            try:
+                while True:
+                    with stage(self.timer, 'decode'):
+                        ret_val, img0 = cap.read()
+                    if not ret_val:
+                        break
+                    frame = cap.frame
+                    msg = f'video {i + 1}/{self.nf} ({frame}/{nframes}) {path}: '
+                    yield (path, cap, frame, 'video', msg), load_letterboxed, \
+                        (img0, self.img_size, self.stride, self.timer)
+            finally:  # also when the generator is closed early
+                cap.release()
+
+    def __len__(self):
+        return self.nf  # number of files
+
+
+def file_progress(count, nf, mode='image', fraction=0.):
+    # Fraction done of nf files with count images or count + 1 videos started, fraction of the last one done
+    if mode == 'image':
+        return count / nf
+    return (count + fraction) / nf
+
+
+def load_letterboxed(img0, img_size=640, stride=32, timer=None, buffer=None):
+    # Returns (img, img0) for an image path or BGR array: letterboxed 3xhxw RGB img and the original BGR img0.
+    # With a LetterboxBuffer img is its reused slot 0
+    if isinstance(img0, str):
+        with stage(timer, 'decode'):
+            path, img0 = img0, cv2.imread(img0)  # BGR
+        assert img0 is not None, 'Image Not Found ' + path
+
+    with stage(timer, 'letterbox'):
+        if buffer:
+            return buffer(img0)[0], img0
         # Padded resize
-        img = letterbox(img0, self.img_size, stride=self.stride)[0]
+        img = letterbox(img0, img_size, stride=stride)[0]
 
         # Convert
         img = img[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3x416x416
         img = np.ascontiguousarray(img)
+    return img, img0
 
-        return path, img, img0, self.cap
 
-    def new_video(self, path):
-        self.frame = 0
-        self.cap = cv2.VideoCapture(path)
-        self.nframes = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+def load_letterboxed_batch(paths, shape, stride=32, timer=None):
+    # Returns (img, imgs0) for image paths letterboxed to a common hw shape: bsx3xhxw RGB img and original BGR imgs0
+    with stage(timer, 'decode'):
+        imgs0 = [cv2.imread(p) for p in paths]  # BGR
+    for p, img0 in zip(paths, imgs0):
+        assert img0 is not None, 'Image Not Found ' + p
+
+    with stage(timer, 'letterbox'):
+        # Padded resize to batch shape
+        img = np.stack([letterbox(x, shape, auto=False, stride=stride)[0] for x in imgs0], 0)
+
+        # Convert
+        img = img[:, :, :, ::-1].transpose(0, 3, 1, 2)  # BGR to RGB, to bsx3xhxw
+        img = np.ascontiguousarray(img)
+    return img, imgs0
+
+
+class LoadImageBatches(LoadImages):  # for batched inference
+    # Groups images of similar aspect ratio into rectangular batches, as LoadImagesAndLabels(rect=True) does.
+    # Yields (paths, img(bs,3,h,w), imgs0, None) per batch; videos follow frame by frame as in LoadImages
+    def __init__(self, path, img_size=640, stride=32, batch_size=16, pad=0.0, **kwargs):
+        super(LoadImageBatches, self).__init__(path, img_size, stride, **kwargs)  # kwargs: video options
+        self.ni = self.video_flag.count(False)  # number of images
+        images = self.files[:self.ni]
+
+        # Sort images by aspect ratio, read from headers only
+        shapes = []
+        for f in images:
+            try:
+                shapes.append(exif_size(Image.open(f)))  # wh
+            except Exception:
+                shapes.append((img_size, img_size))  # unreadable, cv2.imread assert reports it later
+        s = np.array(shapes, dtype=np.float64).reshape(-1, 2)
+        ar = s[:, 1] / s[:, 0]  # aspect ratio
+        irect = ar.argsort()
+        self.files[:self.ni] = [images[i] for i in irect]
+        ar = ar[irect]
+
+        # Set batch shapes
+        bi = np.floor(np.arange(self.ni) / batch_size).astype(int)  # batch index
+        nb = bi[-1] + 1 if self.ni else 0  # number of batches
+        shapes = [[1, 1]] * nb
+        for i in range(nb):
+            ari = ar[bi == i]
+            mini, maxi = ari.min(), ari.max()
+            if maxi < 1:
+                shapes[i] = [maxi, 1]
+            elif mini > 1:
+                shapes[i] = [1, 1 / mini]
+        self.batch = bi  # batch index of image
+        self.batch_shapes = np.ceil(np.array(shapes).reshape(-1, 2) * img_size / stride + pad).astype(int) * stride
+        self.nb = nb
+
+    def __iter__(self):
+        self.count = 0
+        self.bcount = 0  # batch count
+        return self
+
+    def __next__(self):
+        if self.bcount == self.nb:
+            self.count = max(self.count, self.ni)
+            return super(LoadImageBatches, self).__next__()  # videos
+
+        i = np.nonzero(self.batch == self.bcount)[0]
+        shape = tuple(self.batch_shapes[self.bcount])  # hw
+        self.bcount += 1
+        self.count = i[-1] + 1
+        paths = [self.files[j] for j in i]
+        img, imgs0 = load_letterboxed_batch(paths, shape, self.stride, self.timer)
+        return paths, img, imgs0, None
+
+    def jobs(self, start=0):
+        # Image batches first, then video frames as in LoadImages.jobs()
+        for b in range(self.nb):
+            paths = [self.files[j] for j in np.nonzero(self.batch == b)[0]]
+            shape = tuple(self.batch_shapes[b])  # hw
+            yield (paths, None, 0, 'image', ''), load_letterboxed_batch, (paths, shape, self.stride, self.timer)
+        yield from super(LoadImageBatches, self).jobs(max(start, self.ni))
+
+
+class PrefetchLoader:  # for inference
+    # Wraps LoadImages/LoadImageBatches so decode and letterbox run in a thread or process pool ahead of inference.
+    # Yields the same (path, img, img0, cap) tuples in the same order and mirrors the mode, frame, nframes and count
+    # attributes
+    def __init__(self, dataset, workers=2, prefetch=8, processes=False):
+        self.dataset = dataset
+        self.workers, self.prefetch, self.processes = workers, prefetch, processes
+        if processes:
+            dataset.timer = None  # timers do not cross process boundaries
+        self.mode, self.frame, self.nframes, self.count = 'image', 0, 0, 0
+        self.cap = None  # VideoReader of the current video
+        self.prefetcher = None
+
+    def __iter__(self):
+        self.prefetcher = Prefetcher(self.dataset.jobs(), self.workers, self.prefetch, self.processes)
+        self.count, self.cap = 0, None
+        for (path, cap, frame, mode, msg), (img, img0) in self.prefetcher:
+            if mode == 'image':
+                self.count += len(path) if isinstance(path, list) else 1  # images done
+            elif cap is not self.cap:  # next video
+                self.count += self.mode == 'video'  # videos before it done
+                self.cap, self.nframes = cap, cap.nframes
+            self.mode, self.frame = mode, frame
+            if msg:
+                print(msg, end='')
+            yield path, img, img0, cap
+
+    def progress(self):
+        return file_progress(self.count, len(self.dataset), self.mode,
+                             self.cap.fraction(self.frame) if self.cap else 0.)
+
+    def close(self):
+        # Stop the prefetch pool and the feeder, which closes dataset.jobs() and its video reader
+        if self.prefetcher:
+            self.prefetcher.close()
 
     def __len__(self):
-        return self.nf  # number of files
+        return len(self.dataset)
 
 
 class LoadWebcam:  # for inference
@@ -264,8 +578,12 @@ class LoadWebcam:  # for inference
 
 
 class LoadStreams:  # multiple IP or RTSP cameras
+    # Latest-frame-wins: reader threads drain every source at capture speed and keep only the newest frame, so a slow
+    # consumer skips (drops) stale frames instead of falling behind real time. __next__ blocks until at least one
+    # source has a new frame (or stale_timeout passes) and only re-letterboxes sources whose frame changed
     def __init__(self, sources='streams.txt', img_size=640, stride=32):
         self.mode = 'stream'
+        self.timer = None  # optional StageTimer, records 'letterbox' and 'frame_age'
         self.img_size = img_size
         self.stride = stride
 
@@ -276,7 +594,18 @@ class LoadStreams:  # multiple IP or RTSP cameras
             sources = [sources]
 
         n = len(sources)
-        self.imgs = [None] * n
+        self.imgs, self.fps = [None] * n, [0] * n
+        self.seq = [0] * n  # per-source sequence number of the newest captured frame
+        self.taken = [0] * n  # sequence number last handed out
+        self.t_capture = [0.] * n  # capture time of the newest frame
+        self.alive = [True] * n
+        self.captured, self.dropped, self.delivered = [0] * n, [0] * n, [0] * n
+        self.age = [0.] * n  # summed age in ms of delivered frames
+        self.age_max = [0.] * n
+        self.buffer = None  # LetterboxBuffer, a slot per source keeps its last letterboxed frame
+        self.cond = Condition()
+        self.closed = Event()  # set by close(), stops the reader threads
+        self.stale_timeout = 1.  # seconds without a new frame before __next__ re-delivers the last ones
         self.sources = [clean_str(x) for x in sources]  # clean source names for later
         for i, s in enumerate(sources):
             # Start the thread to read frames from the video stream
@@ -290,32 +619,64 @@ class LoadStreams:  # multiple IP or RTSP cameras
             assert cap.isOpened(), f'Failed to open {s}'
             w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
             h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            self.fps = cap.get(cv2.CAP_PROP_FPS) % 100
+            self.fps[i] = cap.get(cv2.CAP_PROP_FPS) % 100
 
             _, self.imgs[i] = cap.read()  # guarantee first frame
-            thread = Thread(target=self.update, args=([i, cap]), daemon=True)
-            print(f' success ({w}x{h} at {self.fps:.2f} FPS).')
+            self.seq[i], self.captured[i], self.t_capture[i] = 1, 1, time.time()
+            local = isinstance(url, str) and os.path.isfile(url)  # read at their fps, not at disk speed
+            thread = Thread(target=self.update, args=([i, cap, url, local]), daemon=True)
+            print(f' success ({w}x{h} at {self.fps[i]:.2f} FPS).')
             thread.start()
         print('')  # newline
 
         # check for common shapes
-        s = np.stack([letterbox(x, self.img_size, stride=self.stride)[0].shape for x in self.imgs], 0)  # shapes
-        self.rect = np.unique(s, axis=0).shape[0] == 1  # rect inference if all shapes equal
+        s = [(w + l + r, h + t + b) for (w, h), (t, b, l, r), _, _ in
+             (letterbox_params(x.shape[:2], self.img_size, stride=self.stride) for x in self.imgs)]  # shapes
+        self.rect = len(set(s)) == 1  # rect inference if all shapes equal
+        self.buffer = LetterboxBuffer(self.img_size, self.stride, auto=self.rect, n=n)
         if not self.rect:
             print('WARNING: Different stream shapes detected. For optimal performance supply similarly-shaped streams.')
 
-    def update(self, index, cap):
-        # Read next stream frame in a daemon thread
-        n = 0
-        while cap.isOpened():
-            n += 1
-            # _, self.imgs[index] = cap.read()
-            cap.grab()
-            if n == 4:  # read every 4th frame
-                success, im = cap.retrieve()
-                self.imgs[index] = im if success else self.imgs[index] * 0
-                n = 0
-            time.sleep(1 / self.fps)  # wait time
+    def update(self, index, cap, url, local=False, retries=30, reconnects=30):
+        # Read every stream frame in a daemon thread, replacing the newest frame; unread frames count as dropped.
+        # Local files end at their last frame. Cameras and network streams are read through failed reads (dropped
+        # packets, short outages) and reopened after retries consecutive ones, they end after reconnects reopens in a
+        # row without a frame, or on close()
+        dt = 1 / self.fps[index] if local and self.fps[index] else 0
+        t, fails = time.time(), 0
+        while not self.closed.is_set():
+            success, im = cap.read() if cap.isOpened() else (False, None)
+            if not success:
+                if local:  # end of file
+                    break
+                fails += 1
+                if fails % retries == 0:  # reconnect
+                    cap.release()
+                    if fails // retries >= reconnects:
+                        print(f'WARNING: {self.sources[index]} lost after {reconnects} reconnects')
+                        break
+                    if self.closed.wait(1):
+                        break
+                    cap = cv2.VideoCapture(url)
+                else:
+                    self.closed.wait(0.01)
+                continue
+            fails = 0
+            with self.cond:
+                if self.seq[index] > self.taken[index]:
+                    self.dropped[index] += 1  # previous frame was never handed out
+                self.imgs[index] = im
+                self.seq[index] += 1
+                self.captured[index] += 1
+                self.t_capture[index] = time.time()
+                self.cond.notify_all()
+            if dt:
+                t += dt
+                time.sleep(max(t - time.time(), 0))
+        cap.release()
+        with self.cond:
+            self.alive[index] = False
+            self.cond.notify_all()
 
     def __iter__(self):
         self.count = -1
@@ -323,22 +684,58 @@ class LoadStreams:  # multiple IP or RTSP cameras
 
     def __next__(self):
         self.count += 1
-        img0 = self.imgs.copy()
         if cv2.waitKey(1) == ord('q'):  # q to quit
             cv2.destroyAllWindows()
             raise StopIteration
 
-        # Letterbox
-        img = [letterbox(x, self.img_size, auto=self.rect, stride=self.stride)[0] for x in img0]
+        # Wait for at least one new frame. Stalled sources (reconnecting cameras) re-deliver the last frames every
+        # stale_timeout seconds, so the consumer keeps running its quit/cancel checks
+        with self.cond:
+            fresh = lambda: [i for i, (s, t) in enumerate(zip(self.seq, self.taken)) if s > t]
+            t_wait = time.time()
+            while not self.cond.wait_for(lambda: fresh() or not any(self.alive), timeout=0.1):
+                if self.closed.is_set():
+                    raise StopIteration
+                if time.time() - t_wait >= self.stale_timeout:
+                    break
+            new = fresh()
+            if not new and not any(self.alive):  # all streams ended
+                raise StopIteration
+            img0 = self.imgs.copy()
+            now = time.time()
+            for i in new:
+                self.taken[i] = self.seq[i]
+                self.delivered[i] += 1
+                age = (now - self.t_capture[i]) * 1E3
+                self.age[i] += age
+                self.age_max[i] = max(self.age_max[i], age)
+                if self.timer:
+                    self.timer.add('frame_age', age)
+
+        img = self.buffer.out  # unchanged when re-delivering stale frames
+        with stage(self.timer, 'letterbox'):
+            for i in new:  # letterbox and convert changed frames only, into the reused batch
+                img = self.buffer(img0[i], i)
+            for i in [i for i, g in enumerate(self.buffer.geometry) if g is None]:  # all, if the batch was resized
+                img = self.buffer(img0[i], i)
 
-        # Stack
-        img = np.stack(img, 0)
+        return self.sources, img, img0, None
 
-        # Convert
-        img = img[:, :, :, ::-1].transpose(0, 3, 1, 2)  # BGR to RGB, to bsx3x416x416
-        img = np.ascontiguousarray(img)
+    def close(self):
+        # Stop the reader threads, they release their captures
+        self.closed.set()
 
-        return self.sources, img, img0, None
+    def stats(self):
+        # Per-source counters: frames captured, handed out and dropped, mean/max age (ms) of handed out frames
+        with self.cond:
+            return [{'source': s, 'captured': c, 'delivered': d, 'dropped': dr, 'age': a / max(d, 1), 'age_max': am,
+                     'alive': al}
+                    for s, c, d, dr, a, am, al in zip(self.sources, self.captured, self.delivered, self.dropped,
+                                                      self.age, self.age_max, self.alive)]
+
+    def summary(self):
+        return ', '.join(f"{x['source']}: {x['captured']} captured, {x['delivered']} used, {x['dropped']} dropped, "
+                         f"age {x['age']:.1f}ms mean {x['age_max']:.1f}ms max" for x in self.stats())
 
     def __len__(self):
         return 0  # 1E12 frames = 32 streams at 30 FPS for 30 years
@@ -981,9 +1378,8 @@ def replicate(img, labels):
     return img, labels
 
 
-def letterbox(img, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleFill=False, scaleup=True, stride=32):
-    # Resize and pad image while meeting stride-multiple constraints
-    shape = img.shape[:2]  # current shape [height, width]
+def letterbox_params(shape, new_shape=(640, 640), auto=True, scaleFill=False, scaleup=True, stride=32):
+    # letterbox() geometry for an image of hw shape: resized wh, (top, bottom, left, right) padding, ratio, (dw, dh)
     if isinstance(new_shape, int):
         new_shape = (new_shape, new_shape)
 
@@ -1005,13 +1401,72 @@ def letterbox(img, new_shape=(640, 640), color=(114, 114, 114), auto=True, scale
 
     dw /= 2  # divide padding into 2 sides
     dh /= 2
-
-    if shape[::-1] != new_unpad:  # resize
-        img = cv2.resize(img, new_unpad, interpolation=cv2.INTER_LINEAR)
     top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
     left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return new_unpad, (top, bottom, left, right), ratio, (dw, dh)
+
+
+def letterbox(img, new_shape=(640, 640), color=(114, 114, 114), auto=True, scaleFill=False, scaleup=True, stride=32):
+    # Resize and pad image while meeting stride-multiple constraints
+    new_unpad, (top, bottom, left, right), ratio, dwdh = letterbox_params(img.shape[:2], new_shape, auto, scaleFill,
+                                                                         scaleup, stride)
+    if img.shape[1::-1] != new_unpad:  # resize
+        img = cv2.resize(img, new_unpad, interpolation=cv2.INTER_LINEAR)
     img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)  # add border
-    return img, ratio, (dw, dh)
+    return img, ratio, dwdh
+
+
+class LetterboxBuffer:
+    # letterbox(), BGR to RGB and HWC to CHW into a reused (n,3,h,w) uint8 buffer, one slot per image/source.
+    # The image is resized into a reused array and copied channel-reversed straight into the slot interior; the slot
+    # border is only filled when its geometry changes. Two passes over the pixels instead of resize, copyMakeBorder and
+    # the contiguous transpose copy (plus np.stack for batches). The returned buffer is overwritten by later calls
+    def __init__(self, img_size=640, stride=32, auto=True, n=1, color=114):
+        self.img_size, self.stride, self.auto, self.n, self.color = img_size, stride, auto, n, color
+        self.out = None  # (n,3,h,w) uint8
+        self.geometry = [None] * n  # per slot: hw shape of the image its border was filled for
+        self.resized = {}  # wh: reused cv2.resize output
+
+    def __call__(self, img0, i=0):
+        # Letterbox BGR img0 into slot i, returns the whole buffer
+        new_unpad, (top, bottom, left, right), _, _ = letterbox_params(img0.shape[:2], self.img_size, self.auto,
+                                                                       stride=self.stride)
+        w, h = new_unpad
+        shape = (h + top + bottom, w + left + right)
+        if self.out is None or self.out.shape[2:] != shape:
+            self.out = np.empty((self.n, 3, *shape), dtype=np.uint8)
+            self.geometry = [None] * self.n
+        out = self.out[i]
+        if self.geometry[i] != img0.shape[:2]:
+            out[:] = self.color
+            self.geometry[i] = img0.shape[:2]
+        if img0.shape[1::-1] != new_unpad:
+            img0 = self.resized[new_unpad] = cv2.resize(img0, new_unpad, dst=self.resized.get(new_unpad),
+                                                        interpolation=cv2.INTER_LINEAR)
+        out[:, top:top + h, left:left + w] = img0[:, :, ::-1].transpose(2, 0, 1)  # BGR to RGB, to 3xhxw
+        return self.out
+
+
+def tile_batches(img0, size=640, overlap=0.2, batch_size=8, color=114):
+    # Yields (img(bs,3,size,size) RGB, offsets(bs,2) xy) batches of overlapping native-resolution tiles of BGR img0.
+    # Border tiles are shifted inside the image; tiles of images smaller than size are padded bottom-right,
+    # so tile pixel coordinates + offset are img0 pixel coordinates
+    h, w = img0.shape[:2]
+    step = max(int(size * (1 - overlap)), 1)
+    xs, ys = list(range(0, max(w - size, 0) + 1, step)), list(range(0, max(h - size, 0) + 1, step))
+    if xs[-1] + size < w:
+        xs.append(w - size)
+    if ys[-1] + size < h:
+        ys.append(h - size)
+    offsets = [(x, y) for y in ys for x in xs]
+    for i in range(0, len(offsets), batch_size):
+        o = offsets[i:i + batch_size]
+        img = np.full((len(o), size, size, 3), color, dtype=np.uint8)
+        for j, (x, y) in enumerate(o):
+            t = img0[y:y + size, x:x + size]
+            img[j, :t.shape[0], :t.shape[1]] = t
+        img = np.ascontiguousarray(img[..., ::-1].transpose(0, 3, 1, 2))  # BGR to RGB, to bsx3xsizexsize
+        yield img, np.array(o, dtype=np.float32)
 
 
 def random_perspective(img, targets=(), segments=(), degrees=10, translate=.1, scale=.1, shear=10, perspective=0.0,
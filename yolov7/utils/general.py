@@ -700,6 +700,74 @@ def non_max_suppression(prediction, conf_thres=0.25, iou_thres=0.45, classes=Non
     return output
 
 
+def non_max_suppression_batched(prediction, conf_thres=0.25, iou_thres=0.45, classes=None, agnostic=False,
+                                multi_label=False, max_det=300):
+    """Runs Non-Maximum Suppression (NMS) on a batch of inference results with a single torchvision.ops.nms() call,
+    boxes are offset by image and class index instead of looping over images
+
+    Returns:
+         list of detections, on (n,6) tensor per image [xyxy, conf, cls], as non_max_suppression()
+    """
+
+    bs, nc = prediction.shape[0], prediction.shape[2] - 5  # batch size, number of classes
+    max_wh = 4096  # (pixels) maximum box width and height
+    max_nms = 30000  # maximum number of boxes per image into torchvision.ops.nms()
+    multi_label &= nc > 1  # multiple labels per box (adds 0.5ms/img)
+
+    # Candidates of all images, b is the image index of every row
+    b, a = (prediction[..., 4] > conf_thres).nonzero(as_tuple=True)
+    x = prediction[b, a]
+    scores = x[:, 4:5] if nc == 1 else x[:, 5:] * x[:, 4:5]  # conf = obj_conf * cls_conf
+    box = xywh2xyxy(x[:, :4])
+
+    # Detections matrix nx6 (xyxy, conf, cls)
+    if multi_label:
+        i, j = (scores > conf_thres).nonzero(as_tuple=False).T
+        x, b = torch.cat((box[i], scores[i, j, None], j[:, None].float()), 1), b[i]
+    else:  # best class only
+        conf, j = scores.max(1, keepdim=True)
+        i = conf.view(-1) > conf_thres
+        x, b = torch.cat((box, conf, j.float()), 1)[i], b[i]
+
+    # Filter by class
+    if classes is not None:
+        i = (x[:, 5:6] == torch.tensor(classes, device=x.device)).any(1)
+        x, b = x[i], b[i]
+
+    # Check shape
+    if x.shape[0] > max_nms * bs:  # excess boxes
+        i = x[:, 4].argsort(descending=True)[:max_nms * bs]  # sort by confidence
+        x, b = x[i], b[i]
+
+    # Single NMS, offsets in float64 keep coordinates exact for bs * nc groups
+    g = b if agnostic else b * nc + x[:, 5].long()  # group index
+    boxes = x[:, :4].double() + g[:, None].double() * (max_wh * 2)
+    i = torchvision.ops.nms(boxes, x[:, 4].double(), iou_thres)  # sorted by descending score
+
+    # Back to per-image lists in score order, at most max_det per image
+    n = i.shape[0]
+    i = i[(b[i] * n + torch.arange(n, device=i.device)).argsort()]  # group by image, keep score order
+    counts = torch.bincount(b[i], minlength=bs)
+    start = torch.cumsum(counts, 0) - counts
+    i = i[torch.arange(n, device=i.device) - start[b[i]] < max_det]
+    return list(x[i].split(counts.clamp(max=max_det).tolist()))
+
+
+def merge_detections(x, iou_thres=0.45, agnostic=False, merge=False, max_det=1000):
+    # Merges (n,6) [xyxy, conf, cls] detections from overlapping views (e.g. tiles) of the same image with NMS.
+    # merge=True replaces kept boxes by the conf-weighted mean of the boxes they suppress (weighted box fusion)
+    if not len(x):
+        return x
+    c = x[:, 5:6] * (0 if agnostic else x[:, :4].max() + 1)  # classes, offset larger than any coordinate
+    boxes, scores = x[:, :4] + c, x[:, 4]  # boxes (offset by class), scores
+    i = torchvision.ops.nms(boxes, scores, iou_thres)[:max_det]  # NMS
+    if merge:
+        iou = box_iou(boxes[i], boxes) > iou_thres  # iou matrix
+        weights = iou * scores[None]  # box weights
+        x[i, :4] = torch.mm(weights, x[:, :4]).float() / weights.sum(1, keepdim=True)  # merged boxes
+    return x[i]
+
+
 def non_max_suppression_kpt(prediction, conf_thres=0.25, iou_thres=0.45, classes=None, agnostic=False, multi_label=False,
                         labels=(), kpt_label=False, nc=None, nkpt=None):
     """Runs Non-Maximum Suppression (NMS) on inference results
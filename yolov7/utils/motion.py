@@ -0,0 +1,43 @@
+# Motion gating utils
+
+import cv2
+
+
+class MotionGate:
+    # Skips inference on frames that barely differ from the last inferred frame of the same source.
+    # Frames are compared as blurred grayscale thumbnails size pixels wide; a frame changed if more than thres of its
+    # thumbnail pixels differ by more than pixel_thres gray levels. Every refresh-th frame is inferred regardless
+    def __init__(self, thres=0.01, refresh=30, size=64, pixel_thres=25):
+        self.thres, self.refresh, self.size, self.pixel_thres = thres, refresh, size, pixel_thres
+        self.ref = {}  # source: thumbnail of the last inferred frame
+        self.age = {}  # source: frames since the last inferred frame
+        self.n = self.skipped = 0
+
+    def thumbnail(self, im):
+        h, w = im.shape[:2]
+        x = cv2.resize(im, (self.size, max(round(self.size * h / w), 1)), interpolation=cv2.INTER_AREA)
+        x = cv2.cvtColor(x, cv2.COLOR_BGR2GRAY) if x.ndim == 3 else x
+        return cv2.GaussianBlur(x, (3, 3), 0)
+
+    def changed(self, key, thumb):
+        ref = self.ref.get(key)
+        if ref is None or ref.shape != thumb.shape or self.age.get(key, 0) + 1 >= self.refresh:
+            return True
+        return (cv2.absdiff(thumb, ref) > self.pixel_thres).mean() > self.thres
+
+    def __call__(self, keys, ims):
+        # Returns True if the batch of frames ims from sources keys needs inference, in which case they become the new
+        # references; False means the previous detections of every source can be reused
+        thumbs = [self.thumbnail(im) for im in ims]
+        self.n += 1
+        if any(self.changed(k, t) for k, t in zip(keys, thumbs)):
+            for k, t in zip(keys, thumbs):
+                self.ref[k], self.age[k] = t, 0
+            return True
+        for k in keys:
+            self.age[k] += 1
+        self.skipped += 1
+        return False
+
+    def summary(self):
+        return f'{self.n - self.skipped}/{self.n} batches inferred, {self.skipped} skipped'
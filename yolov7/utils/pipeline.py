@@ -0,0 +1,120 @@
+# Pipeline utils: background stages overlapping decode, inference and output
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+_END = object()  # end of stream marker
+
+
+class Prefetcher:
+    # Runs work items in a thread or process pool ahead of the consumer and yields results in input order.
+    #   jobs: iterable of (meta, fn, args) tuples, yields (meta, fn(*args)); fn/args must be picklable for processes
+    #   prefetch: max number of results held ahead of the consumer (bounded queue)
+    def __init__(self, jobs, workers=2, prefetch=8, processes=False):
+        self.pool = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=max(workers, 1))
+        self.q = queue.Queue(maxsize=max(prefetch, 1))
+        self.stop = threading.Event()
+        self.t_feed = 0.  # seconds the producer was blocked on a full queue (consumer is the bottleneck)
+        self.t_wait = 0.  # seconds the consumer was blocked waiting for results (producer is the bottleneck)
+        self.n = 0  # items yielded
+        self.thread = threading.Thread(target=self._feed, args=(jobs,), daemon=True)
+        self.thread.start()
+
+    def _put(self, x):
+        t = time.time()
+        while not self.stop.is_set():
+            try:
+                self.q.put(x, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.t_feed += time.time() - t
+
+    def _feed(self, jobs):
+        try:
+            for meta, fn, args in jobs:
+                if self.stop.is_set():
+                    break
+                self._put((meta, self.pool.submit(fn, *args)))
+        except Exception as e:  # re-raised in the consumer
+            self._put(e)
+        finally:
+            if hasattr(jobs, 'close'):
+                jobs.close()  # generators release what they hold, i.e. video readers, when stopped early
+        self._put(_END)
+
+    def __iter__(self):
+        try:
+            while True:
+                t = time.time()
+                x = self.q.get()
+                if x is _END:
+                    break
+                if isinstance(x, Exception):
+                    raise x
+                meta, f = x
+                result = f.result()
+                self.t_wait += time.time() - t
+                self.n += 1
+                yield meta, result
+        finally:
+            self.close()
+
+    def close(self):
+        # Stop feeding and release the pool, pending results are dropped
+        self.stop.set()
+        self.pool.shutdown(wait=False)
+
+    def summary(self):
+        return f'{self.n} items prefetched, producer blocked {self.t_feed:.3f}s, consumer blocked {self.t_wait:.3f}s'
+
+
+class AsyncStage:
+    # Runs fn(*args) for every put(*args) on a background thread, in order, through a bounded queue.
+    # Mirror of Prefetcher for the output side; errors raised in fn are re-raised on the next put() or close()
+    def __init__(self, fn, maxsize=8):
+        self.fn = fn
+        self.q = queue.Queue(maxsize=max(maxsize, 1))
+        self.error = None
+        self.t_put = 0.  # seconds the producer was blocked on a full queue (this stage is the bottleneck)
+        self.t_idle = 0.  # seconds this stage waited for work (producer is the bottleneck)
+        self.n = 0  # items processed
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            t = time.time()
+            args = self.q.get()
+            self.t_idle += time.time() - t
+            if args is _END:
+                break
+            if self.error is None:  # skip remaining work after a failure
+                try:
+                    self.fn(*args)
+                    self.n += 1
+                except Exception as e:
+                    self.error = e
+
+    def _check(self):
+        if self.error is not None:
+            e, self.error = self.error, None
+            raise e
+
+    def put(self, *args):
+        self._check()
+        t = time.time()
+        self.q.put(args)
+        self.t_put += time.time() - t
+
+    def close(self):
+        # Flush pending work and stop the thread
+        if self.thread.is_alive():
+            self.q.put(_END)
+            self.thread.join()
+        self._check()
+
+    def summary(self):
+        return f'{self.n} items written, producer blocked {self.t_put:.3f}s, writer idle {self.t_idle:.3f}s'
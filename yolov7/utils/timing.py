@@ -0,0 +1,91 @@
+# Latency instrumentation utils
+
+import csv
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import numpy as np
+
+from utils.torch_utils import time_synchronized
+
+
+class StageTimer:
+    # Accumulates per-stage latencies into fixed log-spaced histograms (bounded memory for endless streams).
+    # Usage:
+    #     timer = StageTimer()
+    #     with timer('forward'):
+    #         pred = model(img)
+    #     timer.print(); timer.save('timing.json')  # or .csv
+    edges = np.logspace(-3, 6, int(9 / np.log10(1.01)) + 1)  # ms bucket edges, 1us to 1000s, 1% apart
+
+    def __init__(self, sync=True):
+        self.sync = sync  # CUDA synchronize around stages for accurate GPU timing
+        self.lock = threading.Lock()
+        self.stages = {}  # stage: [counts, n, total, max]
+        self.t0 = time.time()
+        self.last_dump = self.t0
+
+    @contextmanager
+    def __call__(self, stage):
+        t = time_synchronized() if self.sync else time.time()
+        try:
+            yield
+        finally:
+            self.add(stage, ((time_synchronized() if self.sync else time.time()) - t) * 1E3)
+
+    def add(self, stage, ms):
+        # Record one ms sample of stage, thread-safe
+        i = min(int(np.searchsorted(self.edges, ms)), len(self.edges) - 1)
+        with self.lock:
+            s = self.stages.get(stage)
+            if s is None:
+                s = self.stages[stage] = [np.zeros(len(self.edges), dtype=np.int64), 0, 0., 0.]
+            s[0][i] += 1
+            s[1] += 1
+            s[2] += ms
+            s[3] = max(s[3], ms)
+
+    def percentile(self, stage, q):
+        counts = self.stages[stage][0]
+        i = int(np.searchsorted(np.cumsum(counts), q / 100 * counts.sum()))  # first bucket reaching q
+        return float(self.edges[min(i, len(self.edges) - 1)])  # bucket upper edge
+
+    def summary(self):
+        # Returns {stage: {n, mean, p50, p95, p99, max, total}} with times in ms
+        with self.lock:
+            return {k: {'n': n, 'mean': t / max(n, 1), 'p50': self.percentile(k, 50), 'p95': self.percentile(k, 95),
+                        'p99': self.percentile(k, 99), 'max': mx, 'total': t}
+                    for k, (_, n, t, mx) in self.stages.items()}
+
+    def print(self):
+        s = self.summary()
+        print(('%12s' + '%10s' * 6) % ('stage', 'n', 'mean', 'p50', 'p95', 'p99', 'max'))
+        for k, v in s.items():
+            print(('%12s%10g' + '%10.2f' * 5) % (k, v['n'], v['mean'], v['p50'], v['p95'], v['p99'], v['max']))
+
+    def save(self, path):
+        # Save summary to *.json or *.csv
+        path, s = Path(path), self.summary()
+        if path.suffix == '.csv':
+            with open(path, 'w', newline='') as f:
+                w = csv.writer(f)
+                w.writerow(['stage', 'n', 'mean', 'p50', 'p95', 'p99', 'max', 'total'])
+                for k, v in s.items():
+                    w.writerow([k, *v.values()])
+        else:
+            with open(path, 'w') as f:
+                json.dump({'elapsed': time.time() - self.t0, 'unit': 'ms', 'stages': s}, f, indent=2)
+
+    def dump(self, path, interval=0.):
+        # Save at most every interval seconds, for periodic reports of long streams
+        if time.time() - self.last_dump >= interval:
+            self.last_dump = time.time()
+            self.save(path)
+
+
+def stage(timer, name):
+    # Context timing name with timer, no-op if timer is None
+    return timer(name) if timer is not None else nullcontext()
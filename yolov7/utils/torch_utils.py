@@ -1,6 +1,7 @@
 # YOLOR PyTorch utils
 
 import datetime
+import hashlib
 import logging
 import math
 import os
@@ -93,6 +94,22 @@ def time_synchronized():
     return time.time()
 
 
+class InputBuffer:
+    # Reused model input: uint8 (3,h,w) or (bs,3,h,w) numpy images are moved to device and converted and scaled to
+    # 0.0 - 1.0 in one torch.div into a preallocated fp16/32 tensor, instead of a float copy and an in-place division
+    def __init__(self, device, half=False):
+        self.device, self.dtype = device, torch.float16 if half else torch.float32
+        self.buf = None
+
+    def __call__(self, img):
+        x = torch.from_numpy(img).to(self.device)
+        if x.ndimension() == 3:
+            x = x.unsqueeze(0)
+        if self.buf is None or self.buf.shape != x.shape:
+            self.buf = torch.empty(x.shape, dtype=self.dtype, device=self.device)
+        return torch.div(x, 255.0, out=self.buf)
+
+
 def profile(x, ops, n=100, device=None):
     # profile a pytorch module or list of modules. Example usage:
     #     x = torch.randn(16, 3, 640, 640)  # input
@@ -340,9 +357,19 @@ def revert_sync_batchnorm(module):
     return module_output
 
 
+def file_hash(files, chunk=1 << 20):
+    # Returns sha256 hex digest of the contents of a file or list of files
+    h = hashlib.sha256()
+    for f in files if isinstance(files, (list, tuple)) else [files]:
+        with open(f, 'rb') as fi:
+            for b in iter(lambda: fi.read(chunk), b''):
+                h.update(b)
+    return h.hexdigest()
+
+
 class TracedModel(nn.Module):
 
-    def __init__(self, model=None, device=None, img_size=(640,640)): 
+    def __init__(self, model=None, device=None, img_size=(640,640), weights=None, cache_dir='runs/traced'): 
         super(TracedModel, self).__init__()
         
         print(" Convert model to Traced-model... ") 
@@ -357,12 +384,28 @@ class TracedModel(nn.Module):
         self.detect_layer = self.model.model[-1]
         self.model.traced = True
         
-        rand_example = torch.rand(1, 3, img_size, img_size)
-        
-        traced_script_module = torch.jit.trace(self.model, rand_example, strict=False)
-        #traced_script_module = torch.jit.script(self.model)
-        traced_script_module.save("traced_model.pt")
-        print(" traced_script_module saved! ")
+        # Traced modules are cached per weights content, image size, device and dtype
+        f = None
+        if weights and cache_dir:
+            dtype = str(next(self.model.parameters()).dtype).replace('torch.', '')
+            key = f'{file_hash(weights)[:16]}_{img_size}_{torch.device(device or "cpu").type}_{dtype}_{torch.__version__}'
+            f = Path(cache_dir) / f'{key}.torchscript.pt'
+
+        if f is not None and f.exists():
+            traced_script_module = torch.jit.load(str(f), map_location='cpu')
+            print(f" traced_script_module loaded from {f}")
+        else:
+            rand_example = torch.rand(1, 3, img_size, img_size)
+
+            traced_script_module = torch.jit.trace(self.model, rand_example, strict=False)
+            #traced_script_module = torch.jit.script(self.model)
+            if f is None:
+                f = Path('traced_model.pt')
+            f.parent.mkdir(parents=True, exist_ok=True)
+            tmp = f.with_suffix(f'.{os.getpid()}.tmp')  # atomic save, concurrent runs never see partial files
+            traced_script_module.save(str(tmp))
+            os.replace(tmp, f)
+            print(f" traced_script_module saved to {f}")
         self.model = traced_script_module
         self.model.to(device)
         self.detect_layer.to(device)
@@ -371,4 +414,4 @@ class TracedModel(nn.Module):
     def forward(self, x, augment=False, profile=False):
         out = self.model(x)
         out = self.detect_layer(out)
-        return out
\ No newline at end of file
+        return out
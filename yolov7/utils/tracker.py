@@ -0,0 +1,123 @@
+# Multi-object tracking utils
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+
+def box_iou_np(box1, box2):
+    # Returns the (n,m) IoU matrix of box1(n,4) and box2(m,4) in xyxy format
+    lt = np.maximum(box1[:, None, :2], box2[None, :, :2])
+    rb = np.minimum(box1[:, None, 2:], box2[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(2)
+    area1 = (box1[:, 2:] - box1[:, :2]).prod(1)
+    area2 = (box2[:, 2:] - box2[:, :2]).prod(1)
+    return inter / (area1[:, None] + area2[None] - inter + 1E-9)
+
+
+def xyxy2cxcywh(x):
+    return np.concatenate(((x[:, :2] + x[:, 2:4]) / 2, x[:, 2:4] - x[:, :2]), 1)
+
+
+def cxcywh2xyxy(x):
+    return np.concatenate((x[:, :2] - x[:, 2:4] / 2, x[:, :2] + x[:, 2:4] / 2), 1)
+
+
+class Tracker:
+    # SORT/ByteTrack style tracker: constant velocity Kalman filters on [cx, cy, w, h], same-class IoU association by
+    # Hungarian matching, high confidence detections first and low confidence ones against the remaining tracks.
+    # All tracks are predicted and updated together as (n,8) states and (n,8,8) covariances
+    #   update(det) on detection frames, step() on frames in between; both return (n,7) [xyxy, conf, cls, id]
+    F = np.eye(8) + np.eye(8, k=4)  # state transition, one frame
+    H = np.eye(4, 8)  # measurement
+
+    def __init__(self, iou_thres=0.3, max_age=30, min_hits=3, high_thres=0.5):
+        self.iou_thres = iou_thres  # min IoU for a match
+        self.max_age = max_age  # frames a lost track is kept
+        self.min_hits = min_hits  # matches before a track is reported
+        self.high_thres = high_thres  # first association round confidence
+        self.x = np.zeros((0, 8))  # states [cx, cy, w, h, vcx, vcy, vw, vh]
+        self.P = np.zeros((0, 8, 8))  # covariances
+        self.info = np.zeros((0, 6))  # [conf, cls, id, hits, frames since update, visible]
+        self.frame = 0
+        self.next_id = 1
+
+    def noise(self, x, pos, vel):
+        # Diagonal noise covariances scaled by box size
+        wh = np.tile(np.clip(x[:, 2:4], 1, None), 2)
+        return np.stack([np.diag(d) for d in np.concatenate((pos * wh, vel * wh), 1) ** 2]) if len(x) else \
+            np.zeros((0, 8, 8))
+
+    def predict(self):
+        self.frame += 1
+        if len(self.x):
+            self.x[:, 6:8] *= self.x[:, 2:4] + self.x[:, 6:8] > 0  # stop shrinking at zero size
+            self.x = self.x @ self.F.T
+            self.P = self.F @ self.P @ self.F.T + self.noise(self.x, 1 / 20, 1 / 160)
+            self.info[:, 4] += 1
+
+    def correct(self, i, z):
+        # Kalman update of tracks i with measurements z(n,4) [cx, cy, w, h]
+        P, H = self.P[i], self.H
+        S = H @ P @ H.T + self.noise(z, 1 / 20, 0)[:, :4, :4]
+        K = P @ H.T @ np.linalg.inv(S)
+        self.x[i] += (K @ (z - self.x[i] @ H.T)[..., None])[..., 0]
+        self.P[i] = (np.eye(8) - K @ H) @ P
+
+    def associate(self, tracks, det):
+        # Hungarian matching of tracks(n) indices against det(m,6), returns matched (track, det) pairs and unmatched dets
+        if not len(tracks) or not len(det):
+            return np.zeros((0, 2), dtype=int), np.arange(len(det))
+        iou = box_iou_np(cxcywh2xyxy(self.x[tracks, :4]), det[:, :4])
+        iou *= self.info[tracks, 1:2] == det[None, :, 5]  # same class only
+        t, d = linear_sum_assignment(-iou)
+        ok = iou[t, d] >= self.iou_thres
+        t, d = t[ok], d[ok]
+        return np.stack((tracks[t], d), 1), np.setdiff1d(np.arange(len(det)), d)
+
+    def update(self, det):
+        # Associates det(n,6) [xyxy, conf, cls] numpy detections with the tracks, returns the visible tracks
+        self.predict()
+        high = det[:, 4] >= self.high_thres
+        dh, dl = det[high], det[~high]
+
+        # High confidence detections against all tracks, low confidence against the remaining ones
+        tracks = np.arange(len(self.x))
+        m1, uh = self.associate(tracks, dh)
+        m2, _ = self.associate(np.setdiff1d(tracks, m1[:, 0]), dl)
+        self.info[:, 5] = 0
+        for m, d in ((m1, dh), (m2, dl)):
+            if len(m):
+                i, j = m[:, 0], m[:, 1]
+                self.correct(i, xyxy2cxcywh(d[j, :4]))
+                self.info[i, 0] = d[j, 4]
+                self.info[i, 3] += 1
+                self.info[i, 4] = 0
+                self.info[i, 5] = 1
+
+        # New tracks from unmatched high confidence detections
+        d = dh[uh]
+        if len(d):
+            n = len(d)
+            x = np.concatenate((xyxy2cxcywh(d[:, :4]), np.zeros((n, 4))), 1)
+            P = self.noise(x, 2 / 20, 10 / 160)
+            ids = np.arange(self.next_id, self.next_id + n)
+            self.next_id += n
+            info = np.stack((d[:, 4], d[:, 5], ids, np.ones(n), np.zeros(n), np.ones(n)), 1)
+            self.x, self.P, self.info = np.concatenate((self.x, x)), np.concatenate((self.P, P)), \
+                np.concatenate((self.info, info))
+
+        # Remove lost tracks, report matched and confirmed ones
+        keep = self.info[:, 4] <= self.max_age
+        self.x, self.P, self.info = self.x[keep], self.P[keep], self.info[keep]
+        confirmed = (self.info[:, 3] >= self.min_hits) | (self.frame <= self.min_hits)
+        self.info[:, 5] *= confirmed
+        return self.output()
+
+    def step(self):
+        # Propagates tracks one frame without detections, returns the tracks visible at the last update
+        self.predict()
+        return self.output()
+
+    def output(self):
+        v = self.info[:, 5] > 0
+        return np.concatenate((cxcywh2xyxy(self.x[v, :4]), self.info[v, :3]), 1)
@@ -0,0 +1,181 @@
+# Result writing utils
+
+import json
+import os
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from utils.pipeline import AsyncStage
+from utils.timing import stage
+
+
+class ResultWriter:
+    # Writes detect.py outputs on a background thread: label files in one call per image, images and video frames.
+    # Work is done in submission order; close() flushes everything and releases the open video writer
+    def __init__(self, maxsize=16, timer=None, sinks=()):
+        self.vid_writer = None
+        self.timer = timer  # optional StageTimer, records 'write'
+        self.sinks = list(sinks)  # DetectionSink outputs
+        self.stage = AsyncStage(self._write, maxsize)
+
+    def write_labels(self, path, lines):
+        # Append all label lines of one image/frame to path
+        if lines:
+            self.stage.put('labels', path, lines)
+
+    def write_image(self, path, img):
+        self.stage.put('image', path, img)
+
+    def new_video(self, path, fps, w, h):
+        # Start a new output video, the previous one is released
+        self.stage.put('video', path, fps, w, h)
+
+    def write_frame(self, img):
+        self.stage.put('frame', img)
+
+    def write_detections(self, image, frame, det, ids=None):
+        # Add det(n,6) [xyxy, conf, cls] numpy detections of one image/frame, with optional track ids, to the sinks
+        if self.sinks:
+            self.stage.put('dets', image, frame, det, ids)
+
+    def call(self, fn, *args):
+        # Run fn(*args) after everything submitted so far is written, e.g. to record progress
+        self.stage.put('call', fn, args)
+
+    def _write(self, kind, *args):
+        with stage(self.timer, 'write'):
+            self._write_now(kind, *args)
+
+    def _write_now(self, kind, *args):
+        if kind == 'labels':
+            path, lines = args
+            with open(path, 'a') as f:
+                f.write(''.join(lines))
+        elif kind == 'image':
+            cv2.imwrite(*args)
+        elif kind == 'video':
+            path, fps, w, h = args
+            self._release()
+            self.vid_writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (w, h))
+        elif kind == 'frame':
+            self.vid_writer.write(args[0])
+        elif kind == 'dets':
+            for s in self.sinks:
+                s.add(*args)
+        elif kind == 'call':
+            fn, a = args
+            fn(*a)
+
+    def _release(self):
+        if isinstance(self.vid_writer, cv2.VideoWriter):
+            self.vid_writer.release()  # release previous video writer
+        self.vid_writer = None
+
+    def close(self):
+        try:
+            self.stage.close()
+        finally:
+            self._release()
+            for s in self.sinks:
+                s.close()
+
+    def summary(self):
+        return self.stage.summary()
+
+
+class DetectionSink:
+    # Structured detections output: 'jsonl' writes one {"image", "frame", "xyxy", "conf", "cls", "track"} line per
+    # image/frame; 'parquet' and 'npz' write one row per detection with columns image, frame, x1, y1, x2, y2, conf, cls,
+    # track (-1 if untracked), buffered and written in bulk every chunk rows (parquet row groups, npz part files)
+    columns = ('image', 'frame', 'x1', 'y1', 'x2', 'y2', 'conf', 'cls', 'track')
+
+    def __init__(self, path, fmt='jsonl', chunk=1 << 20):
+        self.path, self.fmt, self.chunk = Path(path), fmt, chunk
+        self.buffer, self.rows, self.parts = [], 0, 0
+        self.f = open(self.path, 'w') if fmt == 'jsonl' else None
+        self.pq = None  # pyarrow.parquet.ParquetWriter
+        if fmt == 'parquet':
+            import pyarrow.parquet  # optional, pip install pyarrow; fail now rather than at the first flush
+
+    def add(self, image, frame, det, ids=None):
+        n = len(det)
+        track = np.asarray(ids, dtype=np.int32) if ids is not None else np.full(n, -1, dtype=np.int32)
+        if self.fmt == 'jsonl':
+            r = {'image': image, 'frame': int(frame), 'xyxy': np.round(det[:, :4], 2).tolist(),
+                 'conf': np.round(det[:, 4], 5).tolist(), 'cls': det[:, 5].astype(int).tolist()}
+            if ids is not None:
+                r['track'] = track.tolist()
+            self.f.write(json.dumps(r) + '\n')
+        elif n:
+            self.buffer.append((np.full(n, image, dtype=object), np.full(n, frame, dtype=np.int32),
+                                det[:, :5].astype(np.float32), det[:, 5].astype(np.int16), track))
+            self.rows += n
+            if self.rows >= self.chunk:
+                self.flush()
+
+    def flush(self):
+        # Write buffered rows as one parquet row group or npz part file
+        if not self.buffer:
+            return
+        image, frame, boxes, cls, track = (np.concatenate(x) for x in zip(*self.buffer))
+        cols = dict(zip(self.columns, (image, frame, *boxes.T, cls, track)))
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.table(cols)
+            if self.pq is None:
+                self.pq = pq.ParquetWriter(self.path, table.schema)
+            self.pq.write_table(table)
+        else:
+            cols['image'] = cols['image'].astype(str)
+            np.savez_compressed(self.path.with_name(f'{self.path.stem}_{self.parts}.npz'), **cols)
+        self.parts += 1
+        self.buffer, self.rows = [], 0
+
+    def close(self):
+        if self.f:
+            self.f.close()
+        else:
+            self.flush()
+            if self.pq:
+                self.pq.close()
+
+
+class ProgressStream:
+    # Machine-readable detect.py progress as JSON lines on file descriptor fd (2 for stderr), at most one line every
+    # interval seconds plus a final {"done": true|false, ...} line from close():
+    #   {"path": "a.mp4", "frame": 120, "nframes": 3000, "progress": 0.04, "images": 120, "fps": 25.1,
+    #    "detections": 342, "counts": {"person": 3}}
+    # images is the number of images/frames done, fps their rate, detections their total and counts the last frame's
+    def __init__(self, fd=2, interval=0.5):
+        self.f = os.fdopen(os.dup(fd), 'w', buffering=1)  # own line buffered copy, closing it leaves fd open
+        self.interval = interval
+        self.t0 = self.t = time.time()
+        self.images = self.detections = 0
+        self.last = None  # (path, frame, nframes, progress, det, names) of the last image/frame
+
+    def update(self, path, frame, nframes, progress, det, names):
+        self.images += 1
+        self.detections += len(det)
+        self.last = (path, frame, nframes, progress, det, names)
+        if time.time() - self.t >= self.interval:
+            self.emit()
+
+    def emit(self, **kwargs):
+        self.t = time.time()
+        r = {'images': self.images, 'fps': round(self.images / max(self.t - self.t0, 1E-9), 2),
+             'detections': self.detections, **kwargs}
+        if self.last:
+            path, frame, nframes, progress, det, names = self.last
+            cls = det[:, 5].int().tolist() if len(det) else []
+            r.update(path=path, frame=int(frame), nframes=int(nframes), progress=round(progress, 4),
+                     counts={names[c]: cls.count(c) for c in sorted(set(cls))})
+        self.f.write(json.dumps(r, separators=(',', ':')) + '\n')
+
+    def close(self, done=True):
+        # Final line, done is False for failed or cancelled runs
+        self.emit(done=done)
+        self.f.close()